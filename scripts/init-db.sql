@@ -26,6 +26,9 @@ GRANT ALL PRIVILEGES ON DATABASE cloudwatch_reports TO report_user;
 CREATE INDEX IF NOT EXISTS idx_users_email_active ON users(email) WHERE is_active = true;
 CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at);
 CREATE INDEX IF NOT EXISTS idx_organizations_name ON organizations(name);
+CREATE INDEX IF NOT EXISTS ix_users_role_active ON users(role, is_active);
+CREATE INDEX IF NOT EXISTS ix_user_sessions_user_active ON user_sessions(user_id, is_active);
+CREATE INDEX IF NOT EXISTS ix_api_keys_user_active ON api_keys(user_id, is_active);
 
 -- Wstawienie przykładowych danych (tylko dla developmentu)
 INSERT INTO users (id, username, email, password_hash, first_name, last_name, role, is_active) 
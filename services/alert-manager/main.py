@@ -2,27 +2,41 @@
 CloudWatch Pro - Alert Manager Service
 """
 
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
 from enum import Enum
+from contextlib import asynccontextmanager
 import asyncio
 import logging
 import uvicorn
 import redis
-import json
+import orjson
 import uuid
+import msgspec
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the notification workers for the lifetime of the app"""
+    workers = [asyncio.create_task(notification_worker()) for _ in range(NOTIFICATION_WORKERS)]
+    yield
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
 app = FastAPI(
     title="CloudWatch Pro - Alert Manager",
     description="Alert management and notification service",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -33,8 +47,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Redis client
-redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
+# Redis clients share bounded pools; workers wait for a free connection
+# instead of opening new ones under load
+redis_pool = redis.BlockingConnectionPool(host='redis', port=6379, db=0, max_connections=64, decode_responses=True)
+redis_client = redis.Redis(connection_pool=redis_pool)
+# Rules are stored as MessagePack blobs, which must come back as raw bytes
+redis_blob_pool = redis.BlockingConnectionPool(host='redis', port=6379, db=0, max_connections=64)
+redis_blob_client = redis.Redis(connection_pool=redis_blob_pool)
+
+# Alert counters maintained on write so /metrics does not scan every alert
+ALERT_COUNT_TOTAL = "alerts:count:total"
+ALERT_COUNT_STATUS = "alerts:count:status:"
+ALERT_COUNT_SEVERITY = "alerts:count:severity:"
+
+# Status change and counter move in one atomic step: HGET the old status,
+# HSET the changed fields, then DECR/INCR the status counters. Alerts created
+# before the counters existed were never counted, so DECR stops at zero.
+# ARGV: new status, counter prefix, then field/value pairs; nil if missing
+update_status_script = redis_client.register_script(
+    "local prev = redis.call('HGET', KEYS[1], 'status') "
+    "if not prev then return false end "
+    "redis.call('HSET', KEYS[1], unpack(ARGV, 3)) "
+    "if prev ~= ARGV[1] then "
+    "if tonumber(redis.call('GET', ARGV[2] .. prev) or '0') > 0 then "
+    "redis.call('DECR', ARGV[2] .. prev) "
+    "end "
+    "redis.call('INCR', ARGV[2] .. ARGV[1]) "
+    "end "
+    "return 1"
+)
+
+# Alert ids scored by trigger time, trimmed to the retention window on write.
+# Only the listing index is trimmed: /alerts shows alerts triggered within the
+# window, whatever their status; older alerts stay readable by id
+ALERTS_BY_TIME = "alerts_by_time"
+ALERTS_BY_TIME_RETENTION = 30 * 24 * 3600
+
+# Triggered alerts wait here for a small pool of workers, which send them
+# in batches instead of one task per alert. The queue is bounded so a slow
+# notifier cannot grow memory without limit; overflow is dropped and logged
+NOTIFICATION_WORKERS = 8
+NOTIFICATION_BATCH_SIZE = 50
+NOTIFICATION_QUEUE_SIZE = 10000
+notification_queue: asyncio.Queue = asyncio.Queue(maxsize=NOTIFICATION_QUEUE_SIZE)
+
+# Key prefixes for the list loops, concatenated as bytes instead of f-strings
+ALERT_KEY_PREFIX = b"alert:"
+RULE_KEY_PREFIX = b"alert_rule:"
 
 class AlertSeverity(str, Enum):
     CRITICAL = "critical"
@@ -52,6 +111,10 @@ class AlertCondition(str, Enum):
     EQUALS = "equals"
     NOT_EQUALS = "not_equals"
 
+# Plain dict lookups for enum members, cheaper than calling the Enum per row
+SEVERITY_BY_VALUE = {member.value: member for member in AlertSeverity}
+STATUS_BY_VALUE = {member.value: member for member in AlertStatus}
+
 class AlertRule(BaseModel):
     name: str = Field(..., description="Alert rule name")
     description: str = Field(..., description="Alert rule description")
@@ -78,7 +141,9 @@ class Alert(BaseModel):
     resolved_at: Optional[datetime] = Field(None, description="When alert was resolved")
     tags: Dict[str, str] = Field(default_factory=dict, description="Alert tags")
 
-class AlertRuleResponse(BaseModel):
+# Response models are msgspec Structs: rows read back from Redis were validated
+# on the way in, so they are built without validation and encoded natively.
+class AlertRuleResponse(msgspec.Struct, frozen=True):
     rule_id: str
     name: str
     description: str
@@ -93,7 +158,7 @@ class AlertRuleResponse(BaseModel):
     tags: Dict[str, str]
     notification_channels: List[str]
 
-class AlertResponse(BaseModel):
+class AlertResponse(msgspec.Struct, frozen=True):
     alert_id: str
     rule_name: str
     description: str
@@ -108,6 +173,33 @@ class AlertResponse(BaseModel):
     last_updated: datetime
     tags: Dict[str, str]
 
+json_encoder = msgspec.json.Encoder()
+rule_encoder = msgspec.msgpack.Encoder()
+rule_decoder = msgspec.msgpack.Decoder(AlertRuleResponse)
+
+def msgspec_response(content: Any) -> Response:
+    """Encode Structs (or lists of them) straight to a JSON response"""
+    return Response(content=json_encoder.encode(content), media_type="application/json")
+
+def alert_from_row(alert_id: str, row: Dict[str, str]) -> AlertResponse:
+    """Build an alert response from a trusted Redis hash, converting each field once"""
+    resolved_at = row.get("resolved_at")
+    return AlertResponse(
+        alert_id=alert_id,
+        rule_name=row["rule_name"],
+        description=row["description"],
+        severity=SEVERITY_BY_VALUE[row["severity"]],
+        status=STATUS_BY_VALUE[row["status"]],
+        resource_id=row["resource_id"],
+        metric_name=row["metric_name"],
+        threshold=float(row["threshold"]),
+        current_value=float(row["current_value"]),
+        triggered_at=datetime.fromisoformat(row["triggered_at"]),
+        resolved_at=datetime.fromisoformat(resolved_at) if resolved_at else None,
+        last_updated=datetime.fromisoformat(row["last_updated"]),
+        tags=orjson.loads(row.get("tags", "{}"))
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -118,35 +210,13 @@ async def health_check():
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail="Service unhealthy")
 
-@app.post("/rules", response_model=AlertRuleResponse)
+@app.post("/rules")
 async def create_alert_rule(rule: AlertRule):
     """Create new alert rule"""
     try:
         rule_id = f"rule_{uuid.uuid4().hex[:8]}"
         
-        rule_data = {
-            "rule_id": rule_id,
-            "name": rule.name,
-            "description": rule.description,
-            "metric_name": rule.metric_name,
-            "condition": rule.condition.value,
-            "threshold": rule.threshold,
-            "duration": rule.duration,
-            "severity": rule.severity.value,
-            "enabled": rule.enabled,
-            "created_at": datetime.utcnow().isoformat(),
-            "created_by": "system",
-            "tags": rule.tags,
-            "notification_channels": rule.notification_channels
-        }
-        
-        # Store in Redis
-        redis_client.hset(f"alert_rule:{rule_id}", mapping=rule_data)
-        redis_client.sadd("alert_rules", rule_id)
-        
-        logger.info(f"Created alert rule: {rule_id}")
-        
-        return AlertRuleResponse(
+        rule_struct = AlertRuleResponse(
             rule_id=rule_id,
             name=rule.name,
             description=rule.description,
@@ -156,66 +226,69 @@ async def create_alert_rule(rule: AlertRule):
             duration=rule.duration,
             severity=rule.severity,
             enabled=rule.enabled,
-            created_at=datetime.fromisoformat(rule_data["created_at"]),
-            created_by=rule_data["created_by"],
+            created_at=datetime.utcnow(),
+            created_by="system",
             tags=rule.tags,
             notification_channels=rule.notification_channels
         )
         
+        # Store in Redis
+        redis_blob_client.set(f"alert_rule:{rule_id}", rule_encoder.encode(rule_struct))
+        redis_client.sadd("alert_rules", rule_id)
+        
+        logger.info(f"Created alert rule: {rule_id}")
+        
+        return msgspec_response(rule_struct)
+        
     except Exception as e:
         logger.error(f"Error creating alert rule: {e}")
         raise HTTPException(status_code=500, detail="Failed to create alert rule")
 
-@app.get("/rules", response_model=List[AlertRuleResponse])
+@app.get("/rules")
 async def list_alert_rules(enabled: Optional[bool] = None):
     """List all alert rules"""
     try:
-        rule_ids = redis_client.smembers("alert_rules")
+        rule_ids = list(redis_client.smembers("alert_rules"))
         rules = []
         
-        for rule_id in rule_ids:
-            rule_data = redis_client.hgetall(f"alert_rule:{rule_id}")
-            if not rule_data:
+        # One round-trip for all rules, each decoded natively from its blob
+        pipe = redis_blob_client.pipeline(transaction=False)
+        for rule_key in [RULE_KEY_PREFIX + rule_id.encode() for rule_id in rule_ids]:
+            pipe.get(rule_key)
+        
+        for blob in pipe.execute():
+            if not blob:
                 continue
-                
-            if enabled is not None and rule_data.get("enabled") != str(enabled).lower():
+            
+            rule = rule_decoder.decode(blob)
+            if enabled is not None and rule.enabled != enabled:
                 continue
                 
-            rules.append(AlertRuleResponse(
-                rule_id=rule_id,
-                name=rule_data["name"],
-                description=rule_data["description"],
-                metric_name=rule_data["metric_name"],
-                condition=AlertCondition(rule_data["condition"]),
-                threshold=float(rule_data["threshold"]),
-                duration=rule_data["duration"],
-                severity=AlertSeverity(rule_data["severity"]),
-                enabled=rule_data["enabled"].lower() == "true",
-                created_at=datetime.fromisoformat(rule_data["created_at"]),
-                created_by=rule_data["created_by"],
-                tags=json.loads(rule_data.get("tags", "{}")),
-                notification_channels=json.loads(rule_data.get("notification_channels", "[]"))
-            ))
+            rules.append(rule)
             
-        return rules
+        return msgspec_response(rules)
         
     except Exception as e:
         logger.error(f"Error listing alert rules: {e}")
         raise HTTPException(status_code=500, detail="Failed to list alert rules")
 
-@app.get("/alerts", response_model=List[AlertResponse])
+@app.get("/alerts")
 async def list_alerts(
     status: Optional[AlertStatus] = None,
     severity: Optional[AlertSeverity] = None,
-    limit: int = 100
+    limit: int = Query(100, ge=1, le=1000)
 ):
-    """List alerts with optional filtering"""
+    """List alerts with optional filtering (alerts triggered in the last 30 days)"""
     try:
-        alert_ids = redis_client.smembers("alerts")
+        # Newest first, sorted server-side so only `limit` ids are transferred
+        alert_ids = redis_client.zrevrange(ALERTS_BY_TIME, 0, limit - 1)
         alerts = []
         
-        for alert_id in list(alert_ids)[:limit]:
-            alert_data = redis_client.hgetall(f"alert:{alert_id}")
+        pipe = redis_client.pipeline(transaction=False)
+        for alert_key in [ALERT_KEY_PREFIX + alert_id.encode() for alert_id in alert_ids]:
+            pipe.hgetall(alert_key)
+        
+        for alert_id, alert_data in zip(alert_ids, pipe.execute()):
             if not alert_data:
                 continue
                 
@@ -225,23 +298,9 @@ async def list_alerts(
             if severity and alert_data.get("severity") != severity.value:
                 continue
                 
-            alerts.append(AlertResponse(
-                alert_id=alert_id,
-                rule_name=alert_data["rule_name"],
-                description=alert_data["description"],
-                severity=AlertSeverity(alert_data["severity"]),
-                status=AlertStatus(alert_data["status"]),
-                resource_id=alert_data["resource_id"],
-                metric_name=alert_data["metric_name"],
-                threshold=float(alert_data["threshold"]),
-                current_value=float(alert_data["current_value"]),
-                triggered_at=datetime.fromisoformat(alert_data["triggered_at"]),
-                resolved_at=datetime.fromisoformat(alert_data["resolved_at"]) if alert_data.get("resolved_at") else None,
-                last_updated=datetime.fromisoformat(alert_data["last_updated"]),
-                tags=json.loads(alert_data.get("tags", "{}"))
-            ))
+            alerts.append(alert_from_row(alert_id, alert_data))
             
-        return sorted(alerts, key=lambda x: x.triggered_at, reverse=True)
+        return msgspec_response(alerts)
         
     except Exception as e:
         logger.error(f"Error listing alerts: {e}")
@@ -251,19 +310,23 @@ async def list_alerts(
 async def update_alert_status(alert_id: str, status: AlertStatus, resolution_note: Optional[str] = None):
     """Update alert status"""
     try:
-        alert_data = redis_client.hgetall(f"alert:{alert_id}")
-        if not alert_data:
-            raise HTTPException(status_code=404, detail="Alert not found")
-            
-        alert_data["status"] = status.value
-        alert_data["last_updated"] = datetime.utcnow().isoformat()
+        alert_key = f"alert:{alert_id}"
+        
+        now = datetime.utcnow().isoformat()
+        changes = {"status": status.value, "last_updated": now}
         
         if status == AlertStatus.RESOLVED:
-            alert_data["resolved_at"] = datetime.utcnow().isoformat()
+            changes["resolved_at"] = now
             if resolution_note:
-                alert_data["resolution_note"] = resolution_note
+                changes["resolution_note"] = resolution_note
                 
-        redis_client.hset(f"alert:{alert_id}", mapping=alert_data)
+        # Write only the changed fields; the script also serves as the
+        # existence check
+        args = [status.value, ALERT_COUNT_STATUS]
+        for field, value in changes.items():
+            args += [field, value]
+        if update_status_script(keys=[alert_key], args=args) is None:
+            raise HTTPException(status_code=404, detail="Alert not found")
         
         logger.info(f"Updated alert {alert_id} status to {status.value}")
         
@@ -279,12 +342,12 @@ async def update_alert_status(alert_id: str, status: AlertStatus, resolution_not
 async def trigger_alert(
     rule_name: str,
     resource_id: str,
-    current_value: float,
-    background_tasks: BackgroundTasks
+    current_value: float
 ):
     """Trigger an alert"""
     try:
         alert_id = f"alert_{uuid.uuid4().hex[:8]}"
+        triggered_at = datetime.utcnow()
         
         # Get rule details (simplified - in real implementation would fetch from rules)
         alert_data = {
@@ -297,17 +360,27 @@ async def trigger_alert(
             "metric_name": "cpu_usage",
             "threshold": 80.0,
             "current_value": current_value,
-            "triggered_at": datetime.utcnow().isoformat(),
-            "last_updated": datetime.utcnow().isoformat(),
+            "triggered_at": triggered_at.isoformat(),
+            "last_updated": triggered_at.isoformat(),
             "tags": "{}"
         }
         
-        # Store alert
-        redis_client.hset(f"alert:{alert_id}", mapping=alert_data)
-        redis_client.sadd("alerts", alert_id)
+        # Store alert and bump counters in one transaction
+        pipe = redis_client.pipeline()
+        pipe.hset(f"alert:{alert_id}", mapping=alert_data)
+        pipe.zadd(ALERTS_BY_TIME, {alert_id: triggered_at.timestamp()})
+        pipe.zremrangebyscore(ALERTS_BY_TIME, "-inf", triggered_at.timestamp() - ALERTS_BY_TIME_RETENTION)
+        pipe.incr(ALERT_COUNT_TOTAL)
+        pipe.incr(ALERT_COUNT_STATUS + alert_data["status"])
+        pipe.incr(ALERT_COUNT_SEVERITY + alert_data["severity"])
+        pipe.execute()
         
-        # Add background task for notifications
-        background_tasks.add_task(send_alert_notification, alert_id, alert_data)
+        # Hand off to the notification workers; the alert itself is already
+        # stored, so a full queue only costs its notification
+        try:
+            notification_queue.put_nowait((alert_id, alert_data))
+        except asyncio.QueueFull:
+            logger.warning(f"Notification queue full, dropping notification for alert {alert_id}")
         
         logger.info(f"Triggered alert: {alert_id}")
         
@@ -317,35 +390,42 @@ async def trigger_alert(
         logger.error(f"Error triggering alert: {e}")
         raise HTTPException(status_code=500, detail="Failed to trigger alert")
 
-async def send_alert_notification(alert_id: str, alert_data: Dict[str, Any]):
-    """Send alert notification (background task)"""
+async def notification_worker():
+    """Drain the notification queue, sending whatever has piled up as one batch"""
+    while True:
+        batch = [await notification_queue.get()]
+        while len(batch) < NOTIFICATION_BATCH_SIZE:
+            try:
+                batch.append(notification_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        
+        await send_alert_notifications(batch)
+        for _ in batch:
+            notification_queue.task_done()
+
+async def send_alert_notifications(batch: List[Tuple[str, Dict[str, Any]]]):
+    """Send notifications for a batch of alerts"""
+    alert_ids = [alert_id for alert_id, _ in batch]
     try:
         # Simulate notification sending
-        logger.info(f"Sending notification for alert {alert_id}")
+        logger.info(f"Sending notifications for alerts {alert_ids}")
         await asyncio.sleep(1)  # Simulate async notification
-        logger.info(f"Notification sent for alert {alert_id}")
+        logger.info(f"Notifications sent for {len(batch)} alerts")
     except Exception as e:
-        logger.error(f"Failed to send notification for alert {alert_id}: {e}")
+        logger.error(f"Failed to send notifications for alerts {alert_ids}: {e}")
 
 @app.get("/metrics")
 async def get_alert_metrics():
     """Get alert metrics and statistics"""
     try:
-        alert_ids = redis_client.smembers("alerts")
-        
-        total_alerts = len(alert_ids)
-        active_alerts = 0
-        critical_alerts = 0
-        warning_alerts = 0
-        
-        for alert_id in alert_ids:
-            alert_data = redis_client.hgetall(f"alert:{alert_id}")
-            if alert_data.get("status") == "active":
-                active_alerts += 1
-            if alert_data.get("severity") == "critical":
-                critical_alerts += 1
-            elif alert_data.get("severity") == "warning":
-                warning_alerts += 1
+        counts = redis_client.mget(
+            ALERT_COUNT_TOTAL,
+            ALERT_COUNT_STATUS + AlertStatus.ACTIVE.value,
+            ALERT_COUNT_SEVERITY + AlertSeverity.CRITICAL.value,
+            ALERT_COUNT_SEVERITY + AlertSeverity.WARNING.value
+        )
+        total_alerts, active_alerts, critical_alerts, warning_alerts = (int(count or 0) for count in counts)
                 
         return {
             "total_alerts": total_alerts,
@@ -3,28 +3,45 @@ CloudWatch Pro - API Gateway Authentication Middleware
 """
 
 import time
-import redis
+import asyncio
+import redis.asyncio as redis
+from cachetools import TTLCache
 from fastapi import HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
+import jwt
+from jwt.exceptions import InvalidTokenError as JWTError
 from typing import Optional, Dict, Any
 import logging
 
-from config import settings
+from config import settings, RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW, TOKEN_ISSUER, TOKEN_AUDIENCE
 
 logger = logging.getLogger(__name__)
 
-# Redis client for rate limiting and token blacklist
-redis_client = redis.Redis(
+# Redis client for rate limiting and token blacklist, backed by a bounded pool
+redis_pool = redis.BlockingConnectionPool(
     host=settings.redis_host,
     port=settings.redis_port,
     db=settings.redis_db,
     password=settings.redis_password if settings.redis_password else None,
+    max_connections=64,
     decode_responses=True
 )
+redis_client = redis.Redis(connection_pool=redis_pool)
 
 security = HTTPBearer()
 
+# Decoded payloads of recently verified tokens, so repeat requests skip
+# signature verification. Only touched from the event loop, so no lock.
+token_cache: TTLCache = TTLCache(maxsize=10000, ttl=60)
+
+# Atomic fixed-window counter: one round-trip, and the window is only
+# started by the request that created the key
+rate_limit_script = redis_client.register_script(
+    "local c = redis.call('INCR', KEYS[1]) "
+    "if c == 1 then redis.call('EXPIRE', KEYS[1], ARGV[1]) end "
+    "return c"
+)
+
 
 async def verify_token(request: Request) -> Optional[Dict[str, Any]]:
     """
@@ -40,24 +57,38 @@ async def verify_token(request: Request) -> Optional[Dict[str, Any]]:
         
         token = authorization.split(" ")[1]
         
-        # Check if token is blacklisted
-        if redis_client.get(f"blacklist:{token}"):
-            raise HTTPException(status_code=401, detail="Token has been revoked")
+        # Start the blacklist lookup now so its round-trip overlaps with
+        # verifying the token locally
+        blacklisted = asyncio.create_task(redis_client.get(f"blacklist:{token}"))
         
-        # Decode and verify token
-        payload = jwt.decode(
-            token, 
-            settings.secret_key, 
-            algorithms=[settings.algorithm]
-        )
+        try:
+            payload = token_cache.get(token)
+            if payload is None:
+                # Decode and verify token
+                payload = jwt.decode(
+                    token, 
+                    settings.secret_key, 
+                    algorithms=[settings.algorithm],
+                    audience=TOKEN_AUDIENCE,
+                    issuer=TOKEN_ISSUER
+                )
+                
+                if payload.get("sub") is None:
+                    raise HTTPException(status_code=401, detail="Invalid token payload")
+                
+                token_cache[token] = payload
+        except Exception:
+            blacklisted.cancel()
+            raise
         
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
+        # Check if token is blacklisted
+        if await blacklisted:
+            raise HTTPException(status_code=401, detail="Token has been revoked")
         
-        # Check token expiration
+        # Check token expiration (cached payloads may outlive the token)
         exp = payload.get("exp")
         if exp and time.time() > exp:
+            token_cache.pop(token, None)
             raise HTTPException(status_code=401, detail="Token has expired")
         
         return payload
@@ -81,27 +112,16 @@ async def rate_limit_middleware(request: Request) -> None:
         # Create rate limit key
         rate_limit_key = f"rate_limit:{client_ip}"
         
-        # Get current request count
-        current_requests = redis_client.get(rate_limit_key)
+        current_requests = await rate_limit_script(
+            keys=[rate_limit_key], 
+            args=[RATE_LIMIT_WINDOW]
+        )
         
-        if current_requests is None:
-            # First request from this IP
-            redis_client.setex(
-                rate_limit_key, 
-                settings.rate_limit_window, 
-                1
+        if current_requests > RATE_LIMIT_REQUESTS:
+            raise HTTPException(
+                status_code=429, 
+                detail="Rate limit exceeded"
             )
-        else:
-            current_requests = int(current_requests)
-            
-            if current_requests >= settings.rate_limit_requests:
-                raise HTTPException(
-                    status_code=429, 
-                    detail="Rate limit exceeded"
-                )
-            
-            # Increment request count
-            redis_client.incr(rate_limit_key)
             
     except HTTPException:
         raise
@@ -117,7 +137,7 @@ def create_access_token(data: Dict[str, Any]) -> str:
     """
     to_encode = data.copy()
     expire = time.time() + (settings.access_token_expire_minutes * 60)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iss": TOKEN_ISSUER, "aud": TOKEN_AUDIENCE})
     
     encoded_jwt = jwt.encode(
         to_encode, 
@@ -128,7 +148,7 @@ def create_access_token(data: Dict[str, Any]) -> str:
     return encoded_jwt
 
 
-def blacklist_token(token: str) -> None:
+async def blacklist_token(token: str) -> None:
     """
     Add token to blacklist
     """
@@ -138,6 +158,8 @@ def blacklist_token(token: str) -> None:
             token, 
             settings.secret_key, 
             algorithms=[settings.algorithm],
+            audience=TOKEN_AUDIENCE,
+            issuer=TOKEN_ISSUER,
             options={"verify_exp": False}
         )
         
@@ -145,7 +167,7 @@ def blacklist_token(token: str) -> None:
         ttl = max(int(exp - time.time()), 1)
         
         # Add to blacklist with TTL
-        redis_client.setex(f"blacklist:{token}", ttl, "1")
+        await redis_client.setex(f"blacklist:{token}", ttl, "1")
         
     except Exception as e:
         logger.error(f"Error blacklisting token: {e}")
@@ -2,9 +2,8 @@
 CloudWatch Pro - API Gateway Configuration
 """
 
-import os
-from typing import List
-from pydantic_settings import BaseSettings
+from typing import Final, List
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
@@ -13,39 +12,47 @@ class Settings(BaseSettings):
     # Application
     app_name: str = "CloudWatch Pro - API Gateway"
     version: str = "1.0.0"
-    environment: str = os.getenv("ENVIRONMENT", "development")
-    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    environment: str = "development"
+    log_level: str = "INFO"
     
     # Server
-    host: str = os.getenv("HOST", "0.0.0.0")
-    port: int = int(os.getenv("PORT", 8000))
+    host: str = "0.0.0.0"
+    port: int = 8000
     
     # Security
-    secret_key: str = os.getenv("SECRET_KEY", "your-super-secret-key-for-development-only")
+    secret_key: str = "your-super-secret-key-for-development-only"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     
     # Redis
-    redis_host: str = os.getenv("REDIS_HOST", "redis")
-    redis_port: int = int(os.getenv("REDIS_PORT", 6379))
-    redis_db: int = int(os.getenv("REDIS_DB", 0))
-    redis_password: str = os.getenv("REDIS_PASSWORD", "")
+    redis_host: str = "redis"
+    redis_port: int = 6379
+    redis_db: int = 0
+    redis_password: str = ""
     
     # Rate Limiting
-    rate_limit_requests: int = int(os.getenv("RATE_LIMIT_REQUESTS", 1000))
-    rate_limit_window: int = int(os.getenv("RATE_LIMIT_WINDOW", 3600))
+    rate_limit_requests: int = 1000
+    rate_limit_window: int = 3600
     
     # Service URLs
-    user_service_url: str = os.getenv("USER_SERVICE_URL", "http://user-service:8001")
-    metrics_service_url: str = os.getenv("METRICS_SERVICE_URL", "http://metrics-collector:8002")
+    user_service_url: str = "http://user-service:8001"
+    metrics_service_url: str = "http://metrics-collector:8002"
     
     # CORS
     allowed_origins: List[str] = ["*"]
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
+    # Values are read from the environment (or .env) by field name and cast by type
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=False, env_prefix="")
 
 
 # Global settings instance
 settings = Settings()
+
+# Hot-path values bound once per process, read as plain module globals
+RATE_LIMIT_REQUESTS: Final[int] = settings.rate_limit_requests
+RATE_LIMIT_WINDOW: Final[int] = settings.rate_limit_window
+
+# Claims user-service puts in every access token (TOKEN_ISSUER/TOKEN_AUDIENCE
+# in user-service/auth.py); PyJWT rejects tokens with aud unless it is checked
+TOKEN_ISSUER: Final[str] = "cloudwatch-pro-user-service"
+TOKEN_AUDIENCE: Final[str] = "cloudwatch-pro"
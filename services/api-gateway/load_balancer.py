@@ -8,15 +8,36 @@ from typing import Dict, List
 from collections import defaultdict
 import logging
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
+# Response times kept per service, for memory efficiency
+RESPONSE_WINDOW = 100
+
+
+def _compute_summary(requests: np.ndarray, errors: np.ndarray, time_sums: np.ndarray):
+    """Per-service average response times, error rates and health scores"""
+    samples = np.minimum(requests, RESPONSE_WINDOW)
+    avg_response_times = time_sums / np.maximum(samples, 1)
+    error_rates = errors / np.maximum(requests, 1) * 100
+    error_scores = np.maximum(0, 100 - error_rates * 2)
+    time_scores = np.maximum(0, 100 - (avg_response_times - 100) / 10)
+    health_scores = np.minimum(100, (error_scores + time_scores) / 2)
+    return avg_response_times, error_rates, health_scores
+
 
 class LoadBalancer:
     """Simple load balancer with metrics tracking"""
     
     def __init__(self):
         self.request_counts: Dict[str, int] = defaultdict(int)
-        self.response_times: Dict[str, List[float]] = defaultdict(list)
+        # Ring buffer of recent response times, one row per service. Row
+        # position follows the service's request count, so the slot being
+        # overwritten holds 0 until the window has filled once.
+        self.service_rows: Dict[str, int] = {}
+        self.response_times = np.zeros((8, RESPONSE_WINDOW))
+        self.response_time_sums = np.zeros(8)
         self.error_counts: Dict[str, int] = defaultdict(int)
         self.total_requests = 0
         
@@ -25,14 +46,30 @@ class LoadBalancer:
         self.request_counts[service_name] += 1
         self.total_requests += 1
         
-        # Keep only last 100 response times for memory efficiency
-        if len(self.response_times[service_name]) >= 100:
-            self.response_times[service_name].pop(0)
-        self.response_times[service_name].append(response_time)
+        row = self._service_row(service_name)
+        slot = (self.request_counts[service_name] - 1) % RESPONSE_WINDOW
+        self.response_time_sums[row] += response_time - self.response_times[row, slot]
+        self.response_times[row, slot] = response_time
         
         if is_error:
             self.error_counts[service_name] += 1
             
+    def _service_row(self, service_name: str) -> int:
+        """Get ring buffer row for a service, growing the buffer when full"""
+        row = self.service_rows.get(service_name)
+        if row is None:
+            row = len(self.service_rows)
+            if row == len(self.response_times):
+                self.response_times = np.vstack([self.response_times, np.zeros_like(self.response_times)])
+                self.response_time_sums = np.concatenate([self.response_time_sums, np.zeros_like(self.response_time_sums)])
+            self.service_rows[service_name] = row
+        return row
+        
+    def _samples_per_service(self) -> np.ndarray:
+        """Number of filled ring buffer slots, in service row order"""
+        requests = np.fromiter(self.request_counts.values(), dtype=np.int64, count=len(self.request_counts))
+        return np.minimum(requests, RESPONSE_WINDOW)
+        
     def get_total_requests(self) -> int:
         """Get total number of requests"""
         return self.total_requests
@@ -44,13 +81,14 @@ class LoadBalancer:
     def get_average_response_time(self, service_name: str = None) -> float:
         """Get average response time"""
         if service_name:
-            times = self.response_times.get(service_name, [])
-            return sum(times) / len(times) if times else 0.0
+            row = self.service_rows.get(service_name)
+            if row is None:
+                return 0.0
+            return float(self.response_time_sums[row] / min(self.request_counts[service_name], RESPONSE_WINDOW))
         else:
-            all_times = []
-            for times in self.response_times.values():
-                all_times.extend(times)
-            return sum(all_times) / len(all_times) if all_times else 0.0
+            samples = self._samples_per_service()
+            count = samples.sum()
+            return float(self.response_time_sums[:len(samples)].sum() / count) if count else 0.0
             
     def get_error_rate(self, service_name: str = None) -> float:
         """Get error rate as percentage"""
@@ -109,22 +147,21 @@ class LoadBalancer:
         
     def get_metrics_summary(self) -> Dict:
         """Get comprehensive metrics summary"""
+        # request_counts and service_rows gain services in the same order,
+        # so every per-service array below is aligned by row
+        services = list(self.request_counts.keys())
+        requests = np.fromiter(self.request_counts.values(), dtype=np.float64, count=len(services))
+        errors = np.fromiter((self.error_counts.get(service, 0) for service in services), dtype=np.float64, count=len(services))
+        avg_response_times, error_rates, health_scores = _compute_summary(
+            requests, errors, self.response_time_sums[:len(services)]
+        )
+        
         return {
             "total_requests": self.total_requests,
             "requests_per_service": dict(self.request_counts),
-            "average_response_times": {
-                service: self.get_average_response_time(service)
-                for service in self.request_counts.keys()
-            },
-            "error_rates": {
-                service: self.get_error_rate(service)
-                for service in self.request_counts.keys()
-            },
-            "health_scores": {
-                service: self.get_health_score(service)
-                for service in self.request_counts.keys()
-            },
+            "average_response_times": dict(zip(services, avg_response_times.tolist())),
+            "error_rates": dict(zip(services, error_rates.tolist())),
+            "health_scores": dict(zip(services, health_scores.tolist())),
             "overall_error_rate": self.get_error_rate(),
             "overall_avg_response_time": self.get_average_response_time()
         }
-
@@ -5,44 +5,102 @@ Centralny punkt dostępu do wszystkich mikrousług systemu CloudWatch Pro.
 
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 import asyncio
 import time
 import logging
+import logging.handlers
+import queue
 from typing import Dict, Any, Optional
+from functools import lru_cache
 import os
 import json
 from datetime import datetime
+from contextlib import asynccontextmanager
 
 from auth_middleware import verify_token, rate_limit_middleware
 from service_discovery import ServiceDiscovery
 from load_balancer import LoadBalancer
 from config import settings
 
-# Konfiguracja logowania
-logging.basicConfig(level=logging.INFO)
+# Konfiguracja logowania - rekordy trafiają do kolejki, a zapis na stderr
+# wykonuje wątek w tle, więc pętla zdarzeń nie blokuje się na I/O
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(log_queue)])
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicjalizacja przy starcie i czyszczenie przy zamykaniu"""
+    log_listener.start()
+    logger.info("Starting API Gateway...")
+    
+    # Inicjalizacja service discovery
+    await service_discovery.initialize()
+    
+    # Rejestracja API Gateway w service discovery
+    await service_discovery.register_service(
+        "api-gateway",
+        "0.0.0.0",
+        int(os.getenv("PORT", 8000)),
+        health_check_url="/health"
+    )
+    
+    # Monitorowanie zdrowia mikrousług w tle - /health i routing czytają
+    # zapamiętany status zamiast odpytywać mikrousługi przy każdym żądaniu
+    monitor_task = asyncio.create_task(service_discovery.start_health_monitoring())
+    
+    logger.info("API Gateway started successfully")
+    
+    yield
+    
+    logger.info("Shutting down API Gateway...")
+    
+    monitor_task.cancel()
+    await asyncio.gather(monitor_task, return_exceptions=True)
+    
+    # Wyrejestrowanie z service discovery
+    await service_discovery.deregister_service("api-gateway")
+    
+    # Zamknięcie puli połączeń HTTP
+    await http_client.aclose()
+    
+    logger.info("API Gateway shut down successfully")
+    
+    # Zatrzymanie wątku logowania - opróżnia kolejkę
+    log_listener.stop()
+
 app = FastAPI(
     title="CloudWatch Pro - API Gateway",
     description="Centralny punkt dostępu do mikrousług CloudWatch Pro",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Konfiguracja CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.ALLOWED_ORIGINS,
+    allow_origins=settings.allowed_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Współdzielony klient HTTP - pula połączeń keep-alive do mikrousług
+# zamiast nowego połączenia TCP przy każdym żądaniu
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(30.0, connect=5.0, pool=10.0),
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=30)
+)
+
 # Inicjalizacja komponentów
-service_discovery = ServiceDiscovery()
+service_discovery = ServiceDiscovery(http_client)
 load_balancer = LoadBalancer()
 
 # Mapa routingu do mikrousług
@@ -59,43 +117,44 @@ SERVICE_ROUTES = {
     "/config": "configuration-service"
 }
 
+# Metody, dla których treść żądania jest przekazywana do mikrousługi
+METHODS_WITH_BODY = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+# Nagłówki nieprzekazywane do mikrousług: host oraz nagłówki hop-by-hop
+# (RFC 7230); content-length wylicza httpx dla przekazywanej treści.
+# Nazwy w surowych nagłówkach ASGI są już małymi literami.
+HOP_BY_HOP_HEADERS = frozenset({
+    b"host", b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailers", b"transfer-encoding", b"upgrade", b"content-length"
+})
+
+# Nagłówki odpowiedzi mikrousługi nieprzekazywane klientowi; content-length
+# zostaje, bo treść jest przekazywana bajt w bajt
+RESPONSE_HOP_BY_HOP_HEADERS = HOP_BY_HOP_HEADERS - {b"host", b"content-length"}
+
+# Stały nagłówek odpowiedzi zakodowany raz, dopisywany bezpośrednio do raw_headers
+GATEWAY_VERSION_HEADER = (b"x-gateway-version", b"1.0.0")
+
+# Ostatnio sformatowany znacznik czasu: (sekunda epoki, tekst ISO 8601)
+_ts_cache = (0, "")
+
+def utc_timestamp() -> str:
+    """Bieżący czas UTC w ISO 8601, formatowany najwyżej raz na sekundę"""
+    global _ts_cache
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache = (now, datetime.utcfromtimestamp(now).isoformat())
+    return _ts_cache[1]
+
 # Endpointy publiczne (nie wymagające autoryzacji)
-PUBLIC_ENDPOINTS = [
+PUBLIC_ENDPOINTS = frozenset([
     "/auth/login",
     "/auth/register",
     "/health",
     "/docs",
     "/redoc",
     "/openapi.json"
-]
-
-@app.on_startup
-async def startup_event():
-    """Inicjalizacja przy starcie"""
-    logger.info("Starting API Gateway...")
-    
-    # Inicjalizacja service discovery
-    await service_discovery.initialize()
-    
-    # Rejestracja API Gateway w service discovery
-    await service_discovery.register_service(
-        "api-gateway",
-        "0.0.0.0",
-        int(os.getenv("PORT", 8000)),
-        health_check_url="/health"
-    )
-    
-    logger.info("API Gateway started successfully")
-
-@app.on_shutdown
-async def shutdown_event():
-    """Czyszczenie przy zamykaniu"""
-    logger.info("Shutting down API Gateway...")
-    
-    # Wyrejestrowanie z service discovery
-    await service_discovery.deregister_service("api-gateway")
-    
-    logger.info("API Gateway shut down successfully")
+])
 
 @app.get("/")
 async def root():
@@ -104,7 +163,7 @@ async def root():
         "service": "CloudWatch Pro - API Gateway",
         "status": "healthy",
         "version": "1.0.0",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": utc_timestamp(),
         "available_services": list(SERVICE_ROUTES.values())
     }
 
@@ -112,29 +171,22 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     try:
-        # Sprawdzenie dostępności mikrousług
+        # Status mikrousług z ostatniego cyklu monitorowania w tle - bez
+        # żądań HTTP, odpowiedź nie czeka na najwolniejszą mikrousługę
         services_status = {}
-        
-        for route, service_name in SERVICE_ROUTES.items():
-            try:
-                service_url = await service_discovery.get_service_url(service_name)
-                if service_url:
-                    async with httpx.AsyncClient(timeout=5.0) as client:
-                        response = await client.get(f"{service_url}/health")
-                        services_status[service_name] = {
-                            "status": "healthy" if response.status_code == 200 else "unhealthy",
-                            "url": service_url,
-                            "response_time": response.elapsed.total_seconds()
-                        }
-                else:
-                    services_status[service_name] = {
-                        "status": "not_found",
-                        "url": None
-                    }
-            except Exception as e:
+        for service_name in dict.fromkeys(SERVICE_ROUTES.values()):
+            service = service_discovery.services.get(service_name)
+            if service:
+                services_status[service_name] = {
+                    "status": service["status"],
+                    "url": service["url"],
+                    "response_time": service.get("response_time"),
+                    "last_check": service["last_check"]
+                }
+            else:
                 services_status[service_name] = {
-                    "status": "error",
-                    "error": str(e)
+                    "status": "not_found",
+                    "url": None
                 }
         
         # Sprawdzenie ogólnego stanu
@@ -147,11 +199,11 @@ async def health_check():
             "status": overall_status,
             "services": services_status,
             "healthy_services": f"{healthy_services}/{total_services}",
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": utc_timestamp()
         }
     
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
+        logger.error("Health check failed: %s", e)
         return JSONResponse(
             status_code=503,
             content={"status": "unhealthy", "error": str(e)}
@@ -163,7 +215,7 @@ async def gateway_middleware(request: Request, call_next):
     start_time = time.time()
     
     # Logowanie żądania
-    logger.info(f"Request: {request.method} {request.url.path}")
+    logger.info("Request: %s %s", request.method, request.url.path)
     
     try:
         # Rate limiting
@@ -178,22 +230,22 @@ async def gateway_middleware(request: Request, call_next):
         
         # Logowanie odpowiedzi
         process_time = time.time() - start_time
-        logger.info(f"Response: {response.status_code} in {process_time:.4f}s")
+        logger.info("Response: %s in %.4fs", response.status_code, process_time)
         
         # Dodanie nagłówków
-        response.headers["X-Process-Time"] = str(process_time)
-        response.headers["X-Gateway-Version"] = "1.0.0"
+        response.raw_headers.append((b"x-process-time", f"{process_time:.6f}".encode("latin-1")))
+        response.raw_headers.append(GATEWAY_VERSION_HEADER)
         
         return response
     
     except HTTPException as e:
         process_time = time.time() - start_time
-        logger.warning(f"HTTP Exception: {e.status_code} - {e.detail} in {process_time:.4f}s")
+        logger.warning("HTTP Exception: %s - %s in %.4fs", e.status_code, e.detail, process_time)
         raise e
     
     except Exception as e:
         process_time = time.time() - start_time
-        logger.error(f"Unexpected error: {str(e)} in {process_time:.4f}s")
+        logger.error("Unexpected error: %s in %.4fs", e, process_time)
         return JSONResponse(
             status_code=500,
             content={"error": "Internal server error", "message": str(e)}
@@ -219,8 +271,7 @@ async def proxy_request(request: Request, path: str):
     target_url = f"{service_url}/{path}"
     
     # Przygotowanie nagłówków
-    headers = dict(request.headers)
-    headers.pop("host", None)  # Usunięcie nagłówka host
+    headers = [(name, value) for name, value in request.headers.raw if name not in HOP_BY_HOP_HEADERS]
     
     # Przygotowanie parametrów zapytania
     query_params = str(request.url.query) if request.url.query else ""
@@ -229,53 +280,36 @@ async def proxy_request(request: Request, path: str):
     
     try:
         # Wykonanie żądania do mikrousługi
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            
-            if request.method == "GET":
-                response = await client.get(target_url, headers=headers)
-            
-            elif request.method == "POST":
-                body = await request.body()
-                response = await client.post(target_url, headers=headers, content=body)
-            
-            elif request.method == "PUT":
-                body = await request.body()
-                response = await client.put(target_url, headers=headers, content=body)
-            
-            elif request.method == "DELETE":
-                response = await client.delete(target_url, headers=headers)
-            
-            elif request.method == "PATCH":
-                body = await request.body()
-                response = await client.patch(target_url, headers=headers, content=body)
-            
-            elif request.method == "OPTIONS":
-                response = await client.options(target_url, headers=headers)
-            
-            else:
-                raise HTTPException(status_code=405, detail="Method not allowed")
+        body = await request.body() if request.method in METHODS_WITH_BODY else None
+        upstream_request = http_client.build_request(request.method, target_url, headers=headers, content=body)
         
-        # Przygotowanie odpowiedzi
-        response_headers = dict(response.headers)
-        response_headers.pop("content-encoding", None)  # Usunięcie problematycznych nagłówków
-        response_headers.pop("transfer-encoding", None)
+        response = await http_client.send(upstream_request, stream=True)
         
-        return JSONResponse(
+        # Przygotowanie odpowiedzi - surowe bajty (razem z content-encoding)
+        # przekazywane strumieniowo, bez parsowania i ponownego kodowania JSON
+        streaming_response = StreamingResponse(
+            response.aiter_raw(),
             status_code=response.status_code,
-            content=response.json() if response.headers.get("content-type", "").startswith("application/json") else response.text,
-            headers=response_headers
+            background=BackgroundTask(response.aclose)
         )
+        # Surowa lista nagłówków zachowuje powtórzenia (np. kilka Set-Cookie)
+        streaming_response.raw_headers = [
+            (name, value)
+            for name, value in ((name.lower(), value) for name, value in response.headers.raw)
+            if name not in RESPONSE_HOP_BY_HOP_HEADERS
+        ]
+        return streaming_response
     
     except httpx.TimeoutException:
-        logger.error(f"Timeout calling {service_name} at {target_url}")
+        logger.error("Timeout calling %s at %s", service_name, target_url)
         raise HTTPException(status_code=504, detail="Service timeout")
     
     except httpx.ConnectError:
-        logger.error(f"Connection error calling {service_name} at {target_url}")
+        logger.error("Connection error calling %s at %s", service_name, target_url)
         raise HTTPException(status_code=503, detail="Service unavailable")
     
     except Exception as e:
-        logger.error(f"Error proxying request to {service_name}: {str(e)}")
+        logger.error("Error proxying request to %s: %s", service_name, e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/gateway/services")
@@ -286,7 +320,7 @@ async def list_services():
     return {
         "services": services,
         "routes": SERVICE_ROUTES,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": utc_timestamp()
     }
 
 @app.get("/gateway/metrics")
@@ -297,19 +331,49 @@ async def gateway_metrics():
         "requests_per_service": load_balancer.get_requests_per_service(),
         "average_response_time": load_balancer.get_average_response_time(),
         "error_rate": load_balancer.get_error_rate(),
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": utc_timestamp()
     }
 
+# Klucz węzła drzewa z nazwą mikrousługi - nie koliduje z segmentem ścieżki
+ROUTE_SERVICE_KEY = "/"
+
+def build_route_trie(routes: Dict[str, str]) -> Dict[str, Any]:
+    """Budowanie drzewa prefiksów (po segmentach ścieżki) z mapy routingu"""
+    trie: Dict[str, Any] = {}
+    for route_prefix, service_name in routes.items():
+        node = trie
+        for segment in route_prefix.strip("/").split("/"):
+            node = node.setdefault(segment, {})
+        node[ROUTE_SERVICE_KEY] = service_name
+    return trie
+
+def match_route_trie(trie: Dict[str, Any], path: str) -> Optional[str]:
+    """Wartość najdłuższego prefiksu ścieżki zapisanego w drzewie"""
+    node = trie
+    value = None
+    for segment in path.strip("/").split("/"):
+        node = node.get(segment)
+        if node is None:
+            break
+        value = node.get(ROUTE_SERVICE_KEY, value)
+    return value
+
+ROUTE_TRIE = build_route_trie(SERVICE_ROUTES)
+# Endpointy publiczne obejmują też swoje podścieżki (np. /docs/oauth2-redirect)
+PUBLIC_ENDPOINT_TRIE = build_route_trie({endpoint: endpoint for endpoint in PUBLIC_ENDPOINTS})
+
+# Obie funkcje są czystymi funkcjami ścieżki nad stałymi modułu - wynik
+# można zapamiętać bez unieważniania
+@lru_cache(maxsize=4096)
 def find_target_service(path: str) -> Optional[str]:
     """Znajdowanie docelowej mikrousługi na podstawie ścieżki"""
-    for route_prefix, service_name in SERVICE_ROUTES.items():
-        if path.startswith(route_prefix):
-            return service_name
-    return None
+    # Najdłuższy pasujący prefiks wygrywa
+    return match_route_trie(ROUTE_TRIE, path)
 
+@lru_cache(maxsize=4096)
 def is_public_endpoint(path: str) -> bool:
     """Sprawdzenie czy endpoint jest publiczny"""
-    return any(path.startswith(endpoint) for endpoint in PUBLIC_ENDPOINTS)
+    return path in PUBLIC_ENDPOINTS or match_route_trie(PUBLIC_ENDPOINT_TRIE, path) is not None
 
 if __name__ == "__main__":
     import uvicorn
@@ -317,5 +381,8 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=int(os.getenv("PORT", 8000)),
-        reload=True
+        # Pętla zdarzeń libuv i parser HTTP w C zamiast asyncio i h11
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", 1))
     )
\ No newline at end of file
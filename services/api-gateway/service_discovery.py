@@ -4,9 +4,10 @@ CloudWatch Pro - Service Discovery
 
 import asyncio
 import logging
-from typing import Dict, List, Optional
+import time
+from typing import Dict, List, Optional, Tuple
 import httpx
-import redis
+import redis.asyncio as redis
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -15,15 +16,26 @@ logger = logging.getLogger(__name__)
 class ServiceDiscovery:
     """Service discovery and health checking"""
     
-    def __init__(self):
+    def __init__(self, http_client: httpx.AsyncClient):
+        self.http_client = http_client
+        # Caps in-flight health probes below the shared client's pool size
+        self.probe_semaphore = asyncio.Semaphore(50)
         self.redis_client = redis.Redis(
             host=settings.redis_host,
             port=settings.redis_port,
             db=settings.redis_db,
             password=settings.redis_password if settings.redis_password else None,
-            decode_responses=True
+            decode_responses=True,
+            max_connections=50
         )
         self.services: Dict[str, Dict] = {}
+        # Short-lived name -> (url, expires_at) cache so request-time lookups
+        # skip the Redis round-trip; refreshed by successful health checks and
+        # evicted when a service is (re)registered, deregistered or found unhealthy
+        self.url_cache: Dict[str, Tuple[str, float]] = {}
+        self.url_cache_ttl = 10.0
+        # Probes currently running, so concurrent checks of one service share it
+        self.inflight_probes: Dict[str, asyncio.Task] = {}
         
     async def initialize(self):
         """Initialize service discovery"""
@@ -46,9 +58,10 @@ class ServiceDiscovery:
         }
         
         self.services[name] = service_info
+        self.url_cache.pop(name, None)
         
         # Store in Redis
-        self.redis_client.hset(
+        await self.redis_client.hset(
             f"service:{name}",
             mapping={
                 "host": host,
@@ -65,8 +78,9 @@ class ServiceDiscovery:
         """Deregister a service"""
         if name in self.services:
             del self.services[name]
+        self.url_cache.pop(name, None)
             
-        self.redis_client.delete(f"service:{name}")
+        await self.redis_client.delete(f"service:{name}")
         logger.info(f"Deregistered service: {name}")
         
     async def get_service_url(self, name: str) -> Optional[str]:
@@ -75,13 +89,20 @@ class ServiceDiscovery:
             service = self.services[name]
             if service["status"] == "healthy":
                 return service["url"]
-                
+        
+        cached = self.url_cache.get(name)
+        now = time.monotonic()
+        if cached and cached[1] > now:
+            return cached[0]
+            
         # Try to get from Redis
-        service_data = self.redis_client.hgetall(f"service:{name}")
-        if service_data:
-            return service_data.get("url")
+        service_data = await self.redis_client.hgetall(f"service:{name}")
+        url = service_data.get("url") if service_data else None
+        # A URL the last probe found unhealthy is returned but not cached
+        if url and service_data.get("status") != "unhealthy":
+            self.url_cache[name] = (url, now + self.url_cache_ttl)
             
-        return None
+        return url
         
     async def list_services(self) -> List[Dict]:
         """List all registered services"""
@@ -98,7 +119,18 @@ class ServiceDiscovery:
         return services
         
     async def health_check(self, name: str) -> bool:
-        """Perform health check on a service"""
+        """Perform health check on a service, joining a probe already in flight"""
+        probe = self.inflight_probes.get(name)
+        if probe is None:
+            probe = asyncio.create_task(self._probe(name))
+            self.inflight_probes[name] = probe
+            probe.add_done_callback(lambda _: self.inflight_probes.pop(name, None))
+            
+        # Shielded so one cancelled caller doesn't cancel the probe for the rest
+        return await asyncio.shield(probe)
+        
+    async def _probe(self, name: str) -> bool:
+        """Probe a service's health endpoint and record the result"""
         if name not in self.services:
             return False
             
@@ -106,28 +138,34 @@ class ServiceDiscovery:
         health_url = f"{service['url']}{service['health_check_url']}"
         
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(health_url)
-                is_healthy = response.status_code == 200
-                
-                service["status"] = "healthy" if is_healthy else "unhealthy"
-                service["last_check"] = asyncio.get_event_loop().time()
-                
-                # Update Redis
-                self.redis_client.hset(
-                    f"service:{name}",
-                    "status",
-                    service["status"]
-                )
-                
-                return is_healthy
-                
+            async with self.probe_semaphore:
+                response = await self.http_client.get(health_url, timeout=5.0)
+            is_healthy = response.status_code == 200
+            
+            service["status"] = "healthy" if is_healthy else "unhealthy"
+            service["last_check"] = asyncio.get_event_loop().time()
+            service["response_time"] = response.elapsed.total_seconds()
+            if is_healthy:
+                self.url_cache[name] = (service["url"], time.monotonic() + self.url_cache_ttl)
+            else:
+                self.url_cache.pop(name, None)
+            
+            # Update Redis
+            await self.redis_client.hset(
+                f"service:{name}",
+                "status",
+                service["status"]
+            )
+            
+            return is_healthy
+            
         except Exception as e:
             logger.warning(f"Health check failed for {name}: {e}")
             service["status"] = "unhealthy"
             service["last_check"] = asyncio.get_event_loop().time()
+            self.url_cache.pop(name, None)
             
-            self.redis_client.hset(
+            await self.redis_client.hset(
                 f"service:{name}",
                 "status",
                 "unhealthy"
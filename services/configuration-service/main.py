@@ -2,17 +2,19 @@
 CloudWatch Pro - Configuration Service
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
 import logging
 import uvicorn
-import redis
-import json
+import redis.asyncio as redis
+import orjson
 import uuid
+from cachetools import TTLCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,7 +23,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="CloudWatch Pro - Configuration Service",
     description="System configuration management service",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 app.add_middleware(
@@ -33,7 +36,13 @@ app.add_middleware(
 )
 
 # Redis client
-redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
+redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True, max_connections=50)
+
+# Serialized /config responses keyed by config_type (None = all types); the
+# endpoint is polled, so repeat calls within a few seconds skip Redis.
+# Cleared on every set/delete handled by this process
+CONFIGS_CACHE_TTL = 5
+configs_cache: TTLCache = TTLCache(maxsize=16, ttl=CONFIGS_CACHE_TTL)
 
 class ConfigType(str, Enum):
     SYSTEM = "system"
@@ -48,11 +57,24 @@ class Configuration(BaseModel):
     description: str = Field(..., description="Configuration description")
     is_sensitive: bool = Field(default=False, description="Whether config is sensitive")
 
+def public_config(key: str, config_data: Dict[str, str]) -> Dict[str, Any]:
+    """Build the client-facing view of a stored configuration"""
+    is_sensitive = config_data.get("is_sensitive", "false").lower() == "true"
+    return {
+        "key": key,
+        # Don't expose sensitive values
+        "value": "***HIDDEN***" if is_sensitive else orjson.loads(config_data["value"]),
+        "type": config_data["type"],
+        "description": config_data["description"],
+        "is_sensitive": is_sensitive,
+        "updated_at": config_data.get("updated_at")
+    }
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
-        redis_client.ping()
+        await redis_client.ping()
         return {"status": "healthy", "service": "configuration-service", "timestamp": datetime.utcnow()}
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -61,33 +83,32 @@ async def health_check():
 @app.get("/config")
 async def get_all_configs(config_type: Optional[ConfigType] = None):
     """Get all configurations"""
+    cached = configs_cache.get(config_type)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    
     try:
-        config_keys = redis_client.smembers("config_keys")
+        config_keys = list(await redis_client.smembers("config_keys"))
         configs = []
         
-        for key in config_keys:
-            config_data = redis_client.hgetall(f"config:{key}")
+        # One round-trip for all configurations instead of one HGETALL per key
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key in config_keys:
+                pipe.hgetall(f"config:{key}")
+            results = await pipe.execute()
+        
+        for key, config_data in zip(config_keys, results):
             if not config_data:
                 continue
                 
             if config_type and config_data.get("type") != config_type.value:
                 continue
                 
-            # Don't expose sensitive values
-            value = config_data["value"]
-            if config_data.get("is_sensitive", "false").lower() == "true":
-                value = "***HIDDEN***"
-                
-            configs.append({
-                "key": key,
-                "value": json.loads(value) if value != "***HIDDEN***" else value,
-                "type": config_data["type"],
-                "description": config_data["description"],
-                "is_sensitive": config_data.get("is_sensitive", "false").lower() == "true",
-                "updated_at": config_data.get("updated_at")
-            })
+            configs.append(public_config(key, config_data))
             
-        return {"configurations": configs}
+        body = orjson.dumps({"configurations": configs})
+        configs_cache[config_type] = body
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
         logger.error(f"Error getting configurations: {e}")
@@ -97,23 +118,18 @@ async def get_all_configs(config_type: Optional[ConfigType] = None):
 async def get_config(key: str):
     """Get specific configuration"""
     try:
-        config_data = redis_client.hgetall(f"config:{key}")
+        # Hot path: the masked response is precomputed on write and served
+        # as-is, without touching the hash or parsing JSON
+        public_json = await redis_client.get(f"config_public:{key}")
+        if public_json is not None:
+            return Response(content=public_json, media_type="application/json")
+        
+        # Configurations written before the public view existed
+        config_data = await redis_client.hgetall(f"config:{key}")
         if not config_data:
             raise HTTPException(status_code=404, detail="Configuration not found")
             
-        # Don't expose sensitive values
-        value = config_data["value"]
-        if config_data.get("is_sensitive", "false").lower() == "true":
-            value = "***HIDDEN***"
-            
-        return {
-            "key": key,
-            "value": json.loads(value) if value != "***HIDDEN***" else value,
-            "type": config_data["type"],
-            "description": config_data["description"],
-            "is_sensitive": config_data.get("is_sensitive", "false").lower() == "true",
-            "updated_at": config_data.get("updated_at")
-        }
+        return public_config(key, config_data)
         
     except HTTPException:
         raise
@@ -127,15 +143,21 @@ async def set_config(config: Configuration):
     try:
         config_data = {
             "key": config.key,
-            "value": json.dumps(config.value),
+            "value": orjson.dumps(config.value).decode(),
             "type": config.type.value,
             "description": config.description,
             "is_sensitive": str(config.is_sensitive).lower(),
             "updated_at": datetime.utcnow().isoformat()
         }
         
-        redis_client.hset(f"config:{config.key}", mapping=config_data)
-        redis_client.sadd("config_keys", config.key)
+        public_json = orjson.dumps(public_config(config.key, config_data))
+        
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(f"config:{config.key}", mapping=config_data)
+            pipe.set(f"config_public:{config.key}", public_json)
+            pipe.sadd("config_keys", config.key)
+            await pipe.execute()
+        configs_cache.clear()
         
         logger.info(f"Set configuration: {config.key}")
         
@@ -149,11 +171,14 @@ async def set_config(config: Configuration):
 async def delete_config(key: str):
     """Delete configuration"""
     try:
-        if not redis_client.exists(f"config:{key}"):
+        if not await redis_client.exists(f"config:{key}"):
             raise HTTPException(status_code=404, detail="Configuration not found")
             
-        redis_client.delete(f"config:{key}")
-        redis_client.srem("config_keys", key)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(f"config:{key}", f"config_public:{key}")
+            pipe.srem("config_keys", key)
+            await pipe.execute()
+        configs_cache.clear()
         
         logger.info(f"Deleted configuration: {key}")
         
@@ -166,5 +191,5 @@ async def delete_config(key: str):
         raise HTTPException(status_code=500, detail="Failed to delete configuration")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8009)
+    uvicorn.run(app, host="0.0.0.0", port=8009, loop="uvloop", http="httptools")
 
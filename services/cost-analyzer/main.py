@@ -2,26 +2,40 @@
 CloudWatch Pro - Cost Analyzer Service
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from typing import Any, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 from enum import Enum
+from contextlib import asynccontextmanager
+from functools import wraps
 import logging
+import os
+import time
 import uvicorn
-import redis
-import json
-import random
+import redis.asyncio as redis
+import orjson
+import hashlib
+import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release the Redis connection pool on shutdown"""
+    yield
+    await redis_pool.aclose()
+
 app = FastAPI(
     title="CloudWatch Pro - Cost Analyzer",
     description="Cloud cost analysis and optimization service",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -32,8 +46,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON bodies; small responses aren't worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Redis client
-redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
+redis_pool = redis.ConnectionPool(host='redis', port=6379, db=0, max_connections=50, decode_responses=True)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Shared generator for the simulated cost data
+rng = np.random.default_rng()
+
+# Uniform [0, 1) samples drawn in bulk up front; requests take slices of it
+# and the pool is regenerated in place once exhausted
+RANDOM_POOL_SIZE = 1_000_000
+random_pool = rng.random(RANDOM_POOL_SIZE)
+random_cursor = 0
+
+def draw(n: int, low: float, high: float) -> np.ndarray:
+    """Take n uniform samples in [low, high) from the preallocated pool"""
+    global random_cursor
+    if random_cursor + n > RANDOM_POOL_SIZE:
+        rng.random(out=random_pool)
+        random_cursor = 0
+    samples = random_pool[random_cursor:random_cursor + n] * (high - low) + low
+    random_cursor += n
+    return samples
+
+def draw_choice(options: List[str], shape: Tuple[int, ...]) -> np.ndarray:
+    """Pick options uniformly at random into an array of the given shape"""
+    indices = draw(int(np.prod(shape)), 0, len(options)).astype(np.intp)
+    return np.asarray(options)[indices].reshape(shape)
+
+# Response cache TTLs (seconds) for short and normal-lived endpoints
+CACHE_TTL_SHORT = 10
+CACHE_TTL_NORMAL = 30
+
+def cached(ttl: int):
+    """Cache an endpoint's JSON response in Redis, keyed by its query params"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(**kwargs):
+            params = "&".join(f"{name}={value}" for name, value in sorted(kwargs.items()))
+            cache_key = f"cache:{func.__name__}:{params}"
+            
+            # A Redis outage only disables caching, the endpoint still answers
+            try:
+                body = await redis_client.get(cache_key)
+                if body is not None:
+                    return Response(content=body, media_type="application/json")
+            except redis.RedisError as e:
+                logger.warning(f"Response cache read failed: {e}")
+                
+            body = orjson.dumps(await func(**kwargs))
+            
+            try:
+                await redis_client.setex(cache_key, ttl, body)
+            except redis.RedisError as e:
+                logger.warning(f"Response cache write failed: {e}")
+                
+            return Response(content=body, media_type="application/json")
+        return wrapper
+    return decorator
 
 class CloudProvider(str, Enum):
     AWS = "aws"
@@ -45,46 +118,133 @@ class CostPeriod(str, Enum):
     WEEKLY = "weekly"
     MONTHLY = "monthly"
 
-class CostData(BaseModel):
-    date: datetime
-    service: str
-    provider: CloudProvider
-    cost: float
-    currency: str = "USD"
-    region: str
-    tags: Dict[str, str] = Field(default_factory=dict)
+# Static recommendations, built once and kept sorted by potential savings
+OPTIMIZATION_RECOMMENDATIONS = sorted([
+    {
+        "recommendation_id": "rec_001",
+        "title": "Right-size EC2 instances",
+        "description": "Several EC2 instances are underutilized and can be downsized to save costs",
+        "potential_savings": 450.00,
+        "confidence": 0.85,
+        "priority": "high",
+        "service": "EC2",
+        "provider": "aws",
+        "implementation_effort": "low"
+    },
+    {
+        "recommendation_id": "rec_002",
+        "title": "Use Reserved Instances",
+        "description": "Convert on-demand instances to reserved instances for long-running workloads",
+        "potential_savings": 1200.00,
+        "confidence": 0.95,
+        "priority": "high",
+        "service": "EC2",
+        "provider": "aws",
+        "implementation_effort": "medium"
+    },
+    {
+        "recommendation_id": "rec_003",
+        "title": "Optimize S3 storage classes",
+        "description": "Move infrequently accessed data to cheaper storage classes",
+        "potential_savings": 280.00,
+        "confidence": 0.75,
+        "priority": "medium",
+        "service": "S3",
+        "provider": "aws",
+        "implementation_effort": "low"
+    },
+    {
+        "recommendation_id": "rec_004",
+        "title": "Schedule non-production resources",
+        "description": "Automatically stop development and staging resources during off-hours",
+        "potential_savings": 650.00,
+        "confidence": 0.90,
+        "priority": "medium",
+        "service": "EC2",
+        "provider": "aws",
+        "implementation_effort": "medium"
+    },
+    {
+        "recommendation_id": "rec_005",
+        "title": "Clean up unused resources",
+        "description": "Remove unattached EBS volumes and unused load balancers",
+        "potential_savings": 180.00,
+        "confidence": 0.95,
+        "priority": "low",
+        "service": "EBS",
+        "provider": "aws",
+        "implementation_effort": "low"
+    }
+], key=lambda r: r["potential_savings"], reverse=True)
+
+BUDGET_ALERTS = [
+    {
+        "budget_name": "Monthly Production Budget",
+        "budget_amount": 5000.00,
+        "current_spend": 4250.00,
+        "percentage_used": 85.0,
+        "status": "warning",
+        "days_remaining": 8,
+        "projected_overage": 150.00
+    },
+    {
+        "budget_name": "Development Environment",
+        "budget_amount": 1000.00,
+        "current_spend": 750.00,
+        "percentage_used": 75.0,
+        "status": "ok",
+        "days_remaining": 12,
+        "projected_overage": 0.00
+    }
+]
+
+def prepared_json(payload: Any) -> Tuple[bytes, str]:
+    """Serialize a static payload once and derive its ETag"""
+    body = orjson.dumps(payload)
+    return body, f'"{hashlib.md5(body).hexdigest()}"'
 
-class CostSummary(BaseModel):
-    period: str
-    total_cost: float
-    currency: str
-    breakdown_by_service: Dict[str, float]
-    breakdown_by_provider: Dict[str, float]
-    breakdown_by_region: Dict[str, float]
-    trend_percentage: float
+def static_json_response(request: Request, body: bytes, etag: str) -> Response:
+    """Serve prepared JSON with HTTP caching headers, or 304 if the client's copy is current"""
+    headers = {"Cache-Control": "public, max-age=60", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-class OptimizationRecommendation(BaseModel):
-    recommendation_id: str
-    title: str
-    description: str
-    potential_savings: float
-    confidence: float
-    priority: str
-    service: str
-    provider: CloudProvider
-    implementation_effort: str
+RECOMMENDATIONS_JSON, RECOMMENDATIONS_ETAG = prepared_json(OPTIMIZATION_RECOMMENDATIONS)
+BUDGET_ALERTS_JSON, BUDGET_ALERTS_ETAG = prepared_json({
+    "budget_period": "Monthly",
+    "alerts": BUDGET_ALERTS,
+    "total_budgets": len(BUDGET_ALERTS),
+    "budgets_at_risk": len([a for a in BUDGET_ALERTS if a["status"] == "warning"])
+})
+
+# Liveness probes reuse a Redis ping younger than this many seconds
+HEALTH_PING_TTL = 1.0
+last_health_ok = 0.0
 
 @app.get("/health")
-async def health_check():
+async def health_check(response: Response):
     """Health check endpoint"""
+    if time.monotonic() - last_health_ok < HEALTH_PING_TTL:
+        response.headers["Cache-Control"] = "no-cache"
+        return {"status": "healthy", "service": "cost-analyzer", "timestamp": datetime.now(timezone.utc)}
+    return await deep_health_check(response)
+
+@app.get("/health/deep")
+async def deep_health_check(response: Response):
+    """Health check endpoint that always pings Redis"""
+    global last_health_ok
+    response.headers["Cache-Control"] = "no-cache"
     try:
-        redis_client.ping()
-        return {"status": "healthy", "service": "cost-analyzer", "timestamp": datetime.utcnow()}
+        await redis_client.ping()
+        last_health_ok = time.monotonic()
+        return {"status": "healthy", "service": "cost-analyzer", "timestamp": datetime.now(timezone.utc)}
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail="Service unhealthy")
 
-@app.get("/costs/summary", response_model=CostSummary)
+@app.get("/costs/summary")
+@cached(ttl=CACHE_TTL_NORMAL)
 async def get_cost_summary(
     period: CostPeriod = CostPeriod.MONTHLY,
     start_date: Optional[datetime] = None,
@@ -92,52 +252,41 @@ async def get_cost_summary(
 ):
     """Get cost summary for specified period"""
     try:
+        now = datetime.now(timezone.utc)
         if not start_date:
-            start_date = datetime.utcnow() - timedelta(days=30)
+            start_date = now - timedelta(days=30)
         if not end_date:
-            end_date = datetime.utcnow()
+            end_date = now
             
         # Simulate cost data (in real implementation, would fetch from cloud APIs)
         services = ["EC2", "RDS", "S3", "Lambda", "EKS", "CloudWatch"]
         providers = ["aws", "azure", "gcp"]
         regions = ["us-west-2", "us-east-1", "eu-west-1"]
         
-        total_cost = 0
-        service_costs = {}
-        provider_costs = {}
-        region_costs = {}
-        
-        for service in services:
-            cost = random.uniform(100, 1000)
-            service_costs[service] = round(cost, 2)
-            total_cost += cost
-            
-        for provider in providers:
-            cost = random.uniform(200, 800)
-            provider_costs[provider] = round(cost, 2)
-            
-        for region in regions:
-            cost = random.uniform(150, 600)
-            region_costs[region] = round(cost, 2)
+        service_arr = draw(len(services), 100, 1000)
+        total_cost = float(service_arr.sum())
+        service_costs = dict(zip(services, service_arr.round(2).tolist()))
+        provider_costs = dict(zip(providers, draw(len(providers), 200, 800).round(2).tolist()))
+        region_costs = dict(zip(regions, draw(len(regions), 150, 600).round(2).tolist()))
             
         # Calculate trend (simulate)
-        trend_percentage = random.uniform(-15, 25)
+        trend_percentage = float(draw(1, -15, 25)[0])
         
-        return CostSummary(
-            period=f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}",
-            total_cost=round(total_cost, 2),
-            currency="USD",
-            breakdown_by_service=service_costs,
-            breakdown_by_provider=provider_costs,
-            breakdown_by_region=region_costs,
-            trend_percentage=round(trend_percentage, 2)
-        )
+        return {
+            "period": f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}",
+            "total_cost": round(total_cost, 2),
+            "currency": "USD",
+            "breakdown_by_service": service_costs,
+            "breakdown_by_provider": provider_costs,
+            "breakdown_by_region": region_costs,
+            "trend_percentage": round(trend_percentage, 2)
+        }
         
     except Exception as e:
         logger.error(f"Error getting cost summary: {e}")
         raise HTTPException(status_code=500, detail="Failed to get cost summary")
 
-@app.get("/costs/daily", response_model=List[CostData])
+@app.get("/costs/daily")
 async def get_daily_costs(
     days: int = Query(default=30, ge=1, le=365),
     service: Optional[str] = None,
@@ -145,131 +294,92 @@ async def get_daily_costs(
 ):
     """Get daily cost breakdown"""
     try:
-        costs = []
         services = ["EC2", "RDS", "S3", "Lambda", "EKS"] if not service else [service]
         providers = [CloudProvider.AWS, CloudProvider.AZURE, CloudProvider.GCP] if not provider else [provider]
         regions = ["us-west-2", "us-east-1", "eu-west-1"]
         
-        for i in range(days):
-            date = datetime.utcnow() - timedelta(days=i)
-            
-            for svc in services:
-                for prov in providers:
-                    cost = random.uniform(10, 100)
-                    costs.append(CostData(
-                        date=date,
-                        service=svc,
-                        provider=prov,
-                        cost=round(cost, 2),
-                        region=random.choice(regions),
-                        tags={"environment": random.choice(["prod", "staging", "dev"])}
-                    ))
-                    
-        return sorted(costs, key=lambda x: x.date, reverse=True)
+        # Draw every value for the whole (day, service, provider) grid at once
+        shape = (days, len(services), len(providers))
+        cost_grid = draw(int(np.prod(shape)), 10, 100).reshape(shape).round(2).tolist()
+        region_grid = draw_choice(regions, shape).tolist()
+        environment_grid = draw_choice(["prod", "staging", "dev"], shape).tolist()
+        
+        now = datetime.now(timezone.utc)
+        
+        # Days are generated newest first, so no sorting is needed
+        return [
+            {
+                "date": now - timedelta(days=i),
+                "service": svc,
+                "provider": prov,
+                "cost": cost_grid[i][s][p],
+                "currency": "USD",
+                "region": region_grid[i][s][p],
+                "tags": {"environment": environment_grid[i][s][p]}
+            }
+            for i in range(days)
+            for s, svc in enumerate(services)
+            for p, prov in enumerate(providers)
+        ]
         
     except Exception as e:
         logger.error(f"Error getting daily costs: {e}")
         raise HTTPException(status_code=500, detail="Failed to get daily costs")
 
-@app.get("/optimization/recommendations", response_model=List[OptimizationRecommendation])
+@app.get("/optimization/recommendations")
 async def get_optimization_recommendations(
+    request: Request,
     provider: Optional[CloudProvider] = None,
     min_savings: Optional[float] = None
 ):
     """Get cost optimization recommendations"""
     try:
-        recommendations = [
-            OptimizationRecommendation(
-                recommendation_id="rec_001",
-                title="Right-size EC2 instances",
-                description="Several EC2 instances are underutilized and can be downsized to save costs",
-                potential_savings=450.00,
-                confidence=0.85,
-                priority="high",
-                service="EC2",
-                provider=CloudProvider.AWS,
-                implementation_effort="low"
-            ),
-            OptimizationRecommendation(
-                recommendation_id="rec_002",
-                title="Use Reserved Instances",
-                description="Convert on-demand instances to reserved instances for long-running workloads",
-                potential_savings=1200.00,
-                confidence=0.95,
-                priority="high",
-                service="EC2",
-                provider=CloudProvider.AWS,
-                implementation_effort="medium"
-            ),
-            OptimizationRecommendation(
-                recommendation_id="rec_003",
-                title="Optimize S3 storage classes",
-                description="Move infrequently accessed data to cheaper storage classes",
-                potential_savings=280.00,
-                confidence=0.75,
-                priority="medium",
-                service="S3",
-                provider=CloudProvider.AWS,
-                implementation_effort="low"
-            ),
-            OptimizationRecommendation(
-                recommendation_id="rec_004",
-                title="Schedule non-production resources",
-                description="Automatically stop development and staging resources during off-hours",
-                potential_savings=650.00,
-                confidence=0.90,
-                priority="medium",
-                service="EC2",
-                provider=CloudProvider.AWS,
-                implementation_effort="medium"
-            ),
-            OptimizationRecommendation(
-                recommendation_id="rec_005",
-                title="Clean up unused resources",
-                description="Remove unattached EBS volumes and unused load balancers",
-                potential_savings=180.00,
-                confidence=0.95,
-                priority="low",
-                service="EBS",
-                provider=CloudProvider.AWS,
-                implementation_effort="low"
-            )
-        ]
+        # Unfiltered list is the same for everyone - serve the prepared bytes
+        if not provider and not min_savings:
+            return static_json_response(request, RECOMMENDATIONS_JSON, RECOMMENDATIONS_ETAG)
+            
+        recommendations = OPTIMIZATION_RECOMMENDATIONS
         
         # Filter by provider if specified
         if provider:
-            recommendations = [r for r in recommendations if r.provider == provider]
+            recommendations = [r for r in recommendations if r["provider"] == provider]
             
         # Filter by minimum savings if specified
         if min_savings:
-            recommendations = [r for r in recommendations if r.potential_savings >= min_savings]
+            recommendations = [r for r in recommendations if r["potential_savings"] >= min_savings]
             
-        return sorted(recommendations, key=lambda x: x.potential_savings, reverse=True)
+        return ORJSONResponse(recommendations, headers={"Cache-Control": "private, max-age=30"})
         
     except Exception as e:
         logger.error(f"Error getting optimization recommendations: {e}")
         raise HTTPException(status_code=500, detail="Failed to get optimization recommendations")
 
 @app.get("/costs/forecast")
+@cached(ttl=CACHE_TTL_NORMAL)
 async def get_cost_forecast(days: int = Query(default=30, ge=1, le=365)):
     """Get cost forecast for specified number of days"""
     try:
-        current_daily_avg = random.uniform(80, 120)
-        growth_rate = random.uniform(0.02, 0.08)  # 2-8% monthly growth
+        current_daily_avg = float(draw(1, 80, 120)[0])
+        growth_rate = float(draw(1, 0.02, 0.08)[0])  # 2-8% monthly growth
         
-        forecast = []
-        for i in range(days):
-            date = datetime.utcnow() + timedelta(days=i+1)
-            # Simple linear growth model
-            projected_cost = current_daily_avg * (1 + (growth_rate * i / 30))
-            
-            forecast.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "projected_cost": round(projected_cost, 2),
-                "confidence": max(0.5, 0.95 - (i * 0.01))  # Confidence decreases over time
-            })
+        day_index = np.arange(days)
+        # Simple linear growth model
+        projected_costs = (current_daily_avg * (1 + (growth_rate * day_index / 30))).round(2)
+        # Confidence decreases over time
+        confidences = np.maximum(0.5, 0.95 - (day_index * 0.01))
+        
+        # Day-resolution date arithmetic formats all dates in one call
+        dates = np.datetime_as_string(np.datetime64(datetime.now(timezone.utc).date()) + day_index + 1)
+        forecast = [
+            {
+                "date": date,
+                "projected_cost": projected_cost,
+                "confidence": confidence
+            }
+            for date, projected_cost, confidence in zip(dates.tolist(), projected_costs.tolist(), confidences.tolist())
+        ]
             
-        total_forecast = sum(item["projected_cost"] for item in forecast)
+        total_forecast = float(projected_costs.sum())
         
         return {
             "forecast_period": f"{days} days",
@@ -287,14 +397,17 @@ async def get_cost_forecast(days: int = Query(default=30, ge=1, le=365)):
         raise HTTPException(status_code=500, detail="Failed to get cost forecast")
 
 @app.get("/costs/anomalies")
+@cached(ttl=CACHE_TTL_SHORT)
 async def detect_cost_anomalies():
     """Detect cost anomalies and unusual spending patterns"""
     try:
+        now = datetime.now(timezone.utc)
+        
         # Simulate anomaly detection
         anomalies = [
             {
                 "anomaly_id": "anom_001",
-                "date": (datetime.utcnow() - timedelta(days=1)).strftime("%Y-%m-%d"),
+                "date": (now - timedelta(days=1)).strftime("%Y-%m-%d"),
                 "service": "EC2",
                 "provider": "aws",
                 "expected_cost": 85.50,
@@ -305,7 +418,7 @@ async def detect_cost_anomalies():
             },
             {
                 "anomaly_id": "anom_002",
-                "date": (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%d"),
+                "date": (now - timedelta(days=3)).strftime("%Y-%m-%d"),
                 "service": "S3",
                 "provider": "aws",
                 "expected_cost": 25.00,
@@ -317,7 +430,7 @@ async def detect_cost_anomalies():
         ]
         
         return {
-            "detection_date": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+            "detection_date": now.strftime("%Y-%m-%d %H:%M:%S"),
             "anomalies_found": len(anomalies),
             "anomalies": anomalies
         }
@@ -327,41 +440,24 @@ async def detect_cost_anomalies():
         raise HTTPException(status_code=500, detail="Failed to detect cost anomalies")
 
 @app.get("/costs/budget-alerts")
-async def get_budget_alerts():
+async def get_budget_alerts(request: Request):
     """Get budget alerts and threshold notifications"""
-    try:
-        alerts = [
-            {
-                "budget_name": "Monthly Production Budget",
-                "budget_amount": 5000.00,
-                "current_spend": 4250.00,
-                "percentage_used": 85.0,
-                "status": "warning",
-                "days_remaining": 8,
-                "projected_overage": 150.00
-            },
-            {
-                "budget_name": "Development Environment",
-                "budget_amount": 1000.00,
-                "current_spend": 750.00,
-                "percentage_used": 75.0,
-                "status": "ok",
-                "days_remaining": 12,
-                "projected_overage": 0.00
-            }
-        ]
-        
-        return {
-            "budget_period": "Monthly",
-            "alerts": alerts,
-            "total_budgets": len(alerts),
-            "budgets_at_risk": len([a for a in alerts if a["status"] == "warning"])
-        }
-        
-    except Exception as e:
-        logger.error(f"Error getting budget alerts: {e}")
-        raise HTTPException(status_code=500, detail="Failed to get budget alerts")
+    return static_json_response(request, BUDGET_ALERTS_JSON, BUDGET_ALERTS_ETAG)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8004)
+    # One worker per CPU available to this process (honours cgroup/affinity
+    # limits), overridable with WEB_CONCURRENCY
+    workers = int(os.getenv("WEB_CONCURRENCY", len(os.sched_getaffinity(0))))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8004,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        backlog=2048,
+        limit_concurrency=1000,
+        log_level="warning",
+        access_log=False
+    )
 
@@ -2,15 +2,20 @@
 CloudWatch Pro - Dashboard Service
 """
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
+from contextlib import asynccontextmanager
 import logging
+import os
+import time
 import uvicorn
-import redis
+import redis.asyncio as redis
+import msgspec
 import json
 import uuid
 
@@ -18,10 +23,18 @@ import uuid
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release the Redis connection pools on shutdown"""
+    yield
+    await redis_pool.aclose()
+    await redis_blob_pool.aclose()
+
 app = FastAPI(
     title="CloudWatch Pro - Dashboard Service",
     description="Dashboard management and configuration service",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -32,8 +45,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON bodies; small responses aren't worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Redis client
-redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
+redis_pool = redis.ConnectionPool(host='redis', port=6379, db=0, max_connections=50, decode_responses=True)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Dashboards are stored as MessagePack blobs, which must come back as raw bytes
+redis_blob_pool = redis.ConnectionPool(host='redis', port=6379, db=0, max_connections=50)
+redis_blob_client = redis.Redis(connection_pool=redis_blob_pool)
+
+# Set of all dashboard ids, maintained on create; listing reads it and
+# fetches the blobs with one MGET
+DASHBOARDS_INDEX = "dashboards"
+
+def decode_legacy_dashboard(fields: Dict[bytes, bytes]) -> Dict[str, Any]:
+    """Convert a dashboard hash written before dashboards became single documents"""
+    data = {k.decode(): v.decode() for k, v in fields.items()}
+    return {
+        "dashboard_id": data["dashboard_id"],
+        "name": data["name"],
+        "description": data["description"],
+        "is_public": data.get("is_public", "false").lower() == "true",
+        "layout": json.loads(data["layout"]),
+        "widgets": json.loads(data.get("widgets", "[]")),
+        "tags": json.loads(data.get("tags", "[]")),
+        "created_at": data["created_at"],
+        "updated_at": data.get("updated_at", data["created_at"])
+    }
+
+async def load_dashboard(dashboard_id: str) -> Optional[Dict[str, Any]]:
+    """Read one dashboard blob, migrating a key still in the old hash format"""
+    key = f"dashboard:{dashboard_id}"
+    try:
+        blob = await redis_blob_client.get(key)
+    except redis.ResponseError as e:
+        if not str(e).startswith("WRONGTYPE"):
+            raise
+        fields = await redis_blob_client.hgetall(key)
+        if not fields:
+            return None
+        # Migrate on first read: SET replaces the hash with the blob
+        dashboard_data = decode_legacy_dashboard(fields)
+        await redis_blob_client.set(key, msgspec.msgpack.encode(dashboard_data))
+        return dashboard_data
+    return msgspec.msgpack.decode(blob) if blob else None
 
 class WidgetType(str, Enum):
     LINE_CHART = "line_chart"
@@ -57,11 +114,26 @@ class Widget(BaseModel):
     position: Dict[str, int] = Field(..., description="Widget position and size")
     config: Dict[str, Any] = Field(..., description="Widget configuration")
 
+# Liveness probes reuse a Redis ping younger than this many seconds
+HEALTH_PING_TTL = 1.0
+last_health_ok = 0.0
+
 @app.get("/health")
-async def health_check():
+async def health_check(response: Response):
     """Health check endpoint"""
+    if time.monotonic() - last_health_ok < HEALTH_PING_TTL:
+        response.headers["Cache-Control"] = "no-cache"
+        return {"status": "healthy", "service": "dashboard-service", "timestamp": datetime.utcnow()}
+    return await deep_health_check(response)
+
+@app.get("/health/deep")
+async def deep_health_check(response: Response):
+    """Health check endpoint that always pings Redis"""
+    global last_health_ok
+    response.headers["Cache-Control"] = "no-cache"
     try:
-        redis_client.ping()
+        await redis_client.ping()
+        last_health_ok = time.monotonic()
         return {"status": "healthy", "service": "dashboard-service", "timestamp": datetime.utcnow()}
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -71,23 +143,28 @@ async def health_check():
 async def list_dashboards(user_id: Optional[str] = None):
     """List all dashboards"""
     try:
-        dashboard_ids = redis_client.smembers("dashboards")
+        dashboard_ids = list(await redis_client.smembers(DASHBOARDS_INDEX))
+        keys = [f"dashboard:{dashboard_id}" for dashboard_id in dashboard_ids]
+        blobs = await redis_blob_client.mget(keys) if keys else []
         dashboards = []
         
-        for dashboard_id in dashboard_ids:
-            dashboard_data = redis_client.hgetall(f"dashboard:{dashboard_id}")
-            if not dashboard_data:
-                continue
-                
+        for dashboard_id, blob in zip(dashboard_ids, blobs):
+            if blob is not None:
+                dashboard_data = msgspec.msgpack.decode(blob)
+            else:
+                # MGET returns nil for keys still in the old hash format
+                dashboard_data = await load_dashboard(dashboard_id)
+                if dashboard_data is None:
+                    continue
             dashboards.append({
-                "dashboard_id": dashboard_id,
+                "dashboard_id": dashboard_data["dashboard_id"],
                 "name": dashboard_data["name"],
                 "description": dashboard_data["description"],
-                "is_public": dashboard_data.get("is_public", "false").lower() == "true",
+                "is_public": dashboard_data["is_public"],
                 "created_at": dashboard_data["created_at"],
-                "updated_at": dashboard_data.get("updated_at", dashboard_data["created_at"]),
-                "widgets_count": len(json.loads(dashboard_data.get("widgets", "[]"))),
-                "tags": json.loads(dashboard_data.get("tags", "[]"))
+                "updated_at": dashboard_data["updated_at"],
+                "widgets_count": len(dashboard_data["widgets"]),
+                "tags": dashboard_data["tags"]
             })
             
         return {"dashboards": dashboards}
@@ -101,21 +178,26 @@ async def create_dashboard(dashboard: Dashboard):
     """Create new dashboard"""
     try:
         dashboard_id = f"dash_{uuid.uuid4().hex[:8]}"
+        created_at = datetime.utcnow().isoformat()
         
+        # Every field is always read together, so the dashboard is stored
+        # as a single MessagePack document rather than a hash of JSON strings
         dashboard_data = {
             "dashboard_id": dashboard_id,
             "name": dashboard.name,
             "description": dashboard.description,
-            "is_public": str(dashboard.is_public).lower(),
-            "layout": json.dumps(dashboard.layout),
-            "widgets": json.dumps(dashboard.widgets),
-            "tags": json.dumps(dashboard.tags),
-            "created_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat()
+            "is_public": dashboard.is_public,
+            "layout": dashboard.layout,
+            "widgets": dashboard.widgets,
+            "tags": dashboard.tags,
+            "created_at": created_at,
+            "updated_at": created_at
         }
         
-        redis_client.hset(f"dashboard:{dashboard_id}", mapping=dashboard_data)
-        redis_client.sadd("dashboards", dashboard_id)
+        async with redis_blob_client.pipeline(transaction=True) as pipe:
+            pipe.set(f"dashboard:{dashboard_id}", msgspec.msgpack.encode(dashboard_data))
+            pipe.sadd(DASHBOARDS_INDEX, dashboard_id)
+            await pipe.execute()
         
         logger.info(f"Created dashboard: {dashboard_id}")
         
@@ -132,7 +214,7 @@ async def create_dashboard(dashboard: Dashboard):
 async def get_dashboard(dashboard_id: str):
     """Get dashboard by ID"""
     try:
-        dashboard_data = redis_client.hgetall(f"dashboard:{dashboard_id}")
+        dashboard_data = await load_dashboard(dashboard_id)
         if not dashboard_data:
             raise HTTPException(status_code=404, detail="Dashboard not found")
             
@@ -140,12 +222,12 @@ async def get_dashboard(dashboard_id: str):
             "dashboard_id": dashboard_id,
             "name": dashboard_data["name"],
             "description": dashboard_data["description"],
-            "is_public": dashboard_data.get("is_public", "false").lower() == "true",
-            "layout": json.loads(dashboard_data["layout"]),
-            "widgets": json.loads(dashboard_data["widgets"]),
-            "tags": json.loads(dashboard_data.get("tags", "[]")),
+            "is_public": dashboard_data["is_public"],
+            "layout": dashboard_data["layout"],
+            "widgets": dashboard_data["widgets"],
+            "tags": dashboard_data["tags"],
             "created_at": dashboard_data["created_at"],
-            "updated_at": dashboard_data.get("updated_at", dashboard_data["created_at"])
+            "updated_at": dashboard_data["updated_at"]
         }
         
     except HTTPException:
@@ -155,5 +237,19 @@ async def get_dashboard(dashboard_id: str):
         raise HTTPException(status_code=500, detail="Failed to get dashboard")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8006)
+    # One worker per CPU available to this process (honours cgroup/affinity
+    # limits), overridable with WEB_CONCURRENCY
+    workers = int(os.getenv("WEB_CONCURRENCY", len(os.sched_getaffinity(0))))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8006,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        backlog=2048,
+        limit_concurrency=1000,
+        log_level="warning",
+        access_log=False
+    )
 
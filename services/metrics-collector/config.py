@@ -2,9 +2,9 @@
 CloudWatch Pro - Metrics Collector Configuration
 """
 
-import os
-from typing import List
-from pydantic_settings import BaseSettings
+from functools import lru_cache
+from typing import Tuple
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
@@ -13,40 +13,46 @@ class Settings(BaseSettings):
     # Application
     app_name: str = "CloudWatch Pro - Metrics Collector"
     version: str = "1.0.0"
-    environment: str = os.getenv("ENVIRONMENT", "development")
-    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    environment: str = "development"
+    log_level: str = "INFO"
     
     # Server
-    host: str = os.getenv("HOST", "0.0.0.0")
-    port: int = int(os.getenv("PORT", 8002))
+    host: str = "0.0.0.0"
+    port: int = 8002
     
     # InfluxDB
-    influxdb_url: str = os.getenv("INFLUXDB_URL", "http://influxdb:8086")
-    influxdb_token: str = os.getenv("INFLUXDB_TOKEN", "cloudwatch-super-secret-token")
-    influxdb_org: str = os.getenv("INFLUXDB_ORG", "cloudwatch-pro")
-    influxdb_bucket: str = os.getenv("INFLUXDB_BUCKET", "metrics")
+    influxdb_url: str = "http://influxdb:8086"
+    influxdb_token: str = "cloudwatch-super-secret-token"
+    influxdb_org: str = "cloudwatch-pro"
+    influxdb_bucket: str = "metrics"
     
     # Redis
-    redis_host: str = os.getenv("REDIS_HOST", "redis")
-    redis_port: int = int(os.getenv("REDIS_PORT", 6379))
-    redis_db: int = int(os.getenv("REDIS_DB", 0))
-    redis_password: str = os.getenv("REDIS_PASSWORD", "")
+    redis_host: str = "redis"
+    redis_port: int = 6379
+    redis_db: int = 0
+    redis_password: str = ""
     
     # Kafka
-    kafka_bootstrap_servers: str = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+    kafka_bootstrap_servers: str = "kafka:9092"
     
     # Metrics Collection
-    collection_interval: int = int(os.getenv("COLLECTION_INTERVAL", 60))
-    metrics_retention_days: int = int(os.getenv("METRICS_RETENTION_DAYS", 30))
+    collection_interval: int = 60
+    metrics_retention_days: int = 30
     
     # CORS
-    allowed_origins: List[str] = ["*"]
+    allowed_origins: Tuple[str, ...] = ("*",)
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
+    # Values are read from the environment (or .env) by field name and cast by
+    # type; frozen so the shared instance can't be mutated after load
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=False, env_prefix="", frozen=True)
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Load settings once per process; usable as a FastAPI dependency"""
+    return Settings()
 
 
 # Global settings instance
-settings = Settings()
+settings = get_settings()
 
@@ -5,13 +5,20 @@ Mikrousługa odpowiedzialna za zbieranie metryk z różnych źródeł chmurowych
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any, Optional
+from fastapi.responses import ORJSONResponse, Response
+from typing import List, Dict, Any, Optional, Set
 import uvicorn
 import asyncio
-import json
+import orjson
 import logging
+import hashlib
+import redis.asyncio as redis
+import zstandard
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from functools import lru_cache
 import os
+import time
 
 from collectors import (
     AWSCloudWatchCollector,
@@ -30,12 +37,52 @@ from config import settings
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicjalizacja przy starcie i czyszczenie przy zamykaniu aplikacji"""
+    logger.info("Starting Metrics Collector Service...")
+    
+    # Inicjalizacja połączeń z bazami danych przed przyjęciem pierwszego żądania
+    await influx_storage.initialize()
+    await redis_cache.initialize()
+    
+    # Uruchomienie zadań w tle
+    collection_task = asyncio.create_task(periodic_collection_task())
+    write_task = asyncio.create_task(write_buffer_task())
+    relay_task = asyncio.create_task(broadcast_relay_task())
+    reaper_task = asyncio.create_task(connection_reaper_task())
+    
+    logger.info("Metrics Collector Service started successfully")
+    
+    yield
+    
+    logger.info("Shutting down Metrics Collector Service...")
+    
+    collection_task.cancel()
+    relay_task.cancel()
+    reaper_task.cancel()
+    
+    # Zapisanie metryk pozostałych w buforze przed zamknięciem InfluxDB
+    try:
+        await asyncio.wait_for(write_buffer.join(), timeout=WRITE_SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Dropping {write_buffer.qsize()} buffered metrics on shutdown")
+    write_task.cancel()
+    
+    await influx_storage.close()
+    await redis_cache.close()
+    await broadcast_redis.aclose()
+    
+    logger.info("Metrics Collector Service shut down successfully")
+
 app = FastAPI(
     title="CloudWatch Pro - Metrics Collector",
     description="Mikrousługa zbierania metryk z różnych źródeł chmurowych",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Konfiguracja CORS
@@ -59,32 +106,121 @@ collectors = {
     "prometheus": PrometheusCollector()
 }
 
-# WebSocket connections dla real-time streaming
-active_connections: List[WebSocket] = []
+# Kolejka wiadomości na połączenie WebSocket - rozsyłanie tylko wkłada do
+# kolejek, a wysyłką zajmuje się osobne zadanie każdego połączenia
+STREAM_QUEUE_SIZE = 1000
+STREAM_MERGE_MAX = 50
 
-@app.on_startup
-async def startup_event():
-    """Inicjalizacja przy starcie aplikacji"""
-    logger.info("Starting Metrics Collector Service...")
+# Klienci z ?codec=zstd dostają metryki jako ramki binarne zstd - wiadomość
+# jest kompresowana raz dla wszystkich połączeń, a per-message deflate jest
+# wyłączony w uvicorn, żeby nie kompresować jej osobno na każdym połączeniu
+zstd_compressor = zstandard.ZstdCompressor(level=3)
+
+# Połączenia bez żadnej aktywności (odbioru ani udanej wysyłki) dłużej niż
+# WS_IDLE_TIMEOUT sekund są zamykane przez zadanie sprzątające
+WS_IDLE_TIMEOUT = 300.0
+WS_REAP_INTERVAL = 30.0
+
+# Klient, którego pojedyncza wysyłka trwa dłużej niż WS_SEND_TIMEOUT sekund,
+# jest rozłączany (1013) zamiast blokować swoją kolejkę
+WS_SEND_TIMEOUT = 1.0
+
+class ClientConnection:
+    """Połączenie WebSocket z własną kolejką wiadomości i zadaniem wysyłającym"""
     
-    # Inicjalizacja połączeń z bazami danych
-    await influx_storage.initialize()
-    await redis_cache.initialize()
+    def __init__(self, websocket: WebSocket, compressed: bool = False):
+        self.websocket = websocket
+        self.compressed = compressed
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self.task = asyncio.create_task(self._writer())
+        self.closing: Optional[asyncio.Task] = None
+        self.last_seen = asyncio.get_running_loop().time()
     
-    # Uruchomienie zadań w tle
-    asyncio.create_task(periodic_collection_task())
+    def touch(self):
+        """Zapisanie czasu ostatniej aktywności połączenia"""
+        self.last_seen = asyncio.get_running_loop().time()
     
-    logger.info("Metrics Collector Service started successfully")
-
-@app.on_shutdown
-async def shutdown_event():
-    """Czyszczenie przy zamykaniu aplikacji"""
-    logger.info("Shutting down Metrics Collector Service...")
+    def send(self, payload: str, message: Dict[str, Any], blob: Optional[bytes]):
+        """Przekazanie wiadomości do wysłania bez oczekiwania"""
+        try:
+            self.queue.put_nowait((payload, message, blob))
+        except asyncio.QueueFull:
+            # Klient nie nadąża z odbiorem - rozłączenie zamiast buforowania
+            logger.warning("Dropping slow WebSocket client")
+            self.disconnect(code=1013)
     
-    await influx_storage.close()
-    await redis_cache.close()
+    def disconnect(self, code: int):
+        """Zamknięcie połączenia po stronie serwera"""
+        self.close()
+        self.closing = asyncio.create_task(self.websocket.close(code=code))
     
-    logger.info("Metrics Collector Service shut down successfully")
+    def close(self):
+        """Zatrzymanie wysyłania i usunięcie z aktywnych połączeń"""
+        active_connections.discard(self)
+        self.task.cancel()
+    
+    async def _writer(self):
+        """Wysyłanie wiadomości z kolejki, z łączeniem zaległych w jedną"""
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < STREAM_MERGE_MAX and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            
+            if len(batch) == 1:
+                payload, _, blob = batch[0]
+            else:
+                merged = orjson.dumps({
+                    "type": "metrics",
+                    "data": [metric for _, message, _ in batch for metric in message["data"]],
+                    "timestamp": batch[-1][1]["timestamp"]
+                })
+                payload = merged.decode()
+                blob = zstd_compressor.compress(merged) if self.compressed else None
+            
+            try:
+                if self.compressed:
+                    await asyncio.wait_for(self.websocket.send_bytes(blob), timeout=WS_SEND_TIMEOUT)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(payload), timeout=WS_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Dropping stalled WebSocket client")
+                self.disconnect(code=1013)
+                return
+            except Exception:
+                active_connections.discard(self)
+                return
+            self.touch()
+
+# WebSocket connections dla real-time streaming
+active_connections: Set[ClientConnection] = set()
+
+# Bufor zapisu do InfluxDB - metryki są zapisywane partiami do WRITE_BATCH_MAX
+# punktów lub co WRITE_BATCH_INTERVAL sekund, zamiast jednego zapisu na żądanie
+WRITE_BATCH_MAX = 1000
+WRITE_BATCH_INTERVAL = 1.0
+WRITE_SHUTDOWN_TIMEOUT = 10.0
+write_buffer: asyncio.Queue = asyncio.Queue()
+
+# Każdy worker uvicorn ma własne połączenia WebSocket, więc broadcast idzie
+# przez kanał Redis pub/sub, z którego każdy worker rozsyła do swoich klientów
+BROADCAST_CHANNEL = "metrics:broadcast"
+broadcast_redis = redis.Redis(
+    host=settings.redis_host,
+    port=settings.redis_port,
+    db=settings.redis_db,
+    password=settings.redis_password or None
+)
+
+# Ostatnio sformatowany znacznik czasu: (sekunda epoki, tekst ISO 8601)
+_ts_cache = (0, "")
+
+def utc_timestamp() -> str:
+    """Bieżący czas UTC w ISO 8601, formatowany najwyżej raz na sekundę"""
+    global _ts_cache
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache = (now, datetime.utcfromtimestamp(now).isoformat())
+    return _ts_cache[1]
 
 @app.get("/")
 async def root():
@@ -93,7 +229,7 @@ async def root():
         "service": "CloudWatch Pro - Metrics Collector",
         "status": "healthy",
         "version": "1.0.0",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": utc_timestamp(),
         "active_collectors": list(collectors.keys()),
         "active_connections": len(active_connections)
     }
@@ -123,10 +259,7 @@ async def ingest_metrics(metrics: List[MetricData], background_tasks: Background
     """Przyjmowanie metryk z zewnętrznych źródeł"""
     try:
         # Walidacja i normalizacja metryk
-        normalized_metrics = []
-        for metric in metrics:
-            normalized_metric = await normalize_metric(metric)
-            normalized_metrics.append(normalized_metric)
+        normalized_metrics = normalize_metrics(metrics)
         
         # Zapisanie metryk w tle
         background_tasks.add_task(store_metrics, normalized_metrics)
@@ -137,7 +270,7 @@ async def ingest_metrics(metrics: List[MetricData], background_tasks: Background
         return {
             "status": "accepted",
             "metrics_count": len(metrics),
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": utc_timestamp()
         }
     
     except Exception as e:
@@ -156,11 +289,15 @@ async def query_metrics(
     """Zapytania o metryki"""
     try:
         # Sprawdzenie cache
-        cache_key = f"query:{source}:{metric_name}:{start_time}:{end_time}:{tags}:{limit}"
+        # Klucz o stałej długości niezależnie od liczby tagów
+        raw_key = orjson.dumps((source, metric_name, start_time, end_time, tags, limit))
+        cache_key = f"query:{hashlib.blake2b(raw_key, digest_size=16).hexdigest()}"
         cached_result = await redis_cache.get(cache_key)
         
+        # Odpowiedź z cache jest już gotowym JSON-em - zwracana bez ponownej
+        # walidacji i serializacji
         if cached_result:
-            return MetricResponse.parse_raw(cached_result)
+            return Response(content=cached_result, media_type="application/json")
         
         # Budowanie zapytania
         query = build_influx_query(source, metric_name, start_time, end_time, tags, limit)
@@ -178,33 +315,45 @@ async def query_metrics(
             source=source
         )
         
-        # Zapisanie w cache na 5 minut
-        await redis_cache.set(cache_key, response.json(), expire=300)
+        # Jedna serializacja - te same dane trafiają do cache (na 5 minut)
+        # i do odpowiedzi
+        body = response.model_dump_json()
+        await redis_cache.set(cache_key, body, expire=300)
         
-        return response
+        return Response(content=body, media_type="application/json")
     
     except Exception as e:
         logger.error(f"Error querying metrics: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.websocket("/metrics/stream")
-async def metrics_stream(websocket: WebSocket):
+async def metrics_stream(websocket: WebSocket, codec: Optional[str] = None):
     """WebSocket endpoint dla real-time streaming metryk"""
     await websocket.accept()
-    active_connections.append(websocket)
+    
+    # Ramka informująca klienta o kodowaniu metryk; bez codec=zstd klient
+    # dostaje zwykłe ramki tekstowe JSON jak dotychczas
+    compressed = codec == "zstd"
+    if compressed:
+        await websocket.send_text(orjson.dumps({"type": "codec", "codec": "zstd"}).decode())
+    
+    connection = ClientConnection(websocket, compressed)
+    active_connections.add(connection)
     
     try:
         while True:
             # Oczekiwanie na wiadomości od klienta (np. filtry)
             data = await websocket.receive_text()
-            filters = json.loads(data)
+            connection.touch()
+            filters = orjson.loads(data)
             
             # Aplikacja filtrów do streamingu
             await apply_stream_filters(websocket, filters)
             
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
         logger.info("WebSocket connection closed")
+    finally:
+        connection.close()
 
 @app.post("/sources/configure")
 async def configure_source(config: CollectionConfig):
@@ -220,12 +369,12 @@ async def configure_source(config: CollectionConfig):
         await collector.configure(config.config)
         
         # Zapisanie konfiguracji
-        await redis_cache.set(f"config:{source_type}", config.json())
+        await redis_cache.set(f"config:{source_type}", config.model_dump_json())
         
         return {
             "status": "configured",
             "source_type": source_type,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": utc_timestamp()
         }
     
     except Exception as e:
@@ -237,15 +386,18 @@ async def list_sources():
     """Lista dostępnych źródeł metryk"""
     sources = []
     
-    for source_type, collector in collectors.items():
-        config_data = await redis_cache.get(f"config:{source_type}")
-        
+    # Konfiguracje wszystkich źródeł pobierane równolegle zamiast po kolei
+    configs = await asyncio.gather(
+        *[redis_cache.get(f"config:{source_type}") for source_type in collectors]
+    )
+    
+    for (source_type, collector), config_data in zip(collectors.items(), configs):
         sources.append({
             "type": source_type,
             "status": "active" if collector.is_configured() else "not_configured",
             "last_collection": collector.last_collection_time,
             "metrics_count": collector.metrics_collected,
-            "config": json.loads(config_data) if config_data else None
+            "config": orjson.loads(config_data) if config_data else None
         })
     
     return {"sources": sources}
@@ -267,7 +419,7 @@ async def start_collection(source_type: str, background_tasks: BackgroundTasks):
     return {
         "status": "started",
         "source_type": source_type,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": utc_timestamp()
     }
 
 @app.post("/collection/stop")
@@ -282,49 +434,107 @@ async def stop_collection(source_type: str):
     return {
         "status": "stopped",
         "source_type": source_type,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": utc_timestamp()
     }
 
 # Funkcje pomocnicze
 
-async def normalize_metric(metric: MetricData) -> Dict[str, Any]:
-    """Normalizacja metryki do standardowego formatu"""
-    return {
-        "measurement": metric.name,
-        "tags": metric.tags or {},
-        "fields": {"value": metric.value},
-        "time": metric.timestamp or datetime.utcnow()
-    }
+def normalize_metrics(metrics: List[MetricData]) -> List[Dict[str, Any]]:
+    """Normalizacja partii metryk do standardowego formatu"""
+    # Bez I/O, więc synchronicznie; metryki bez znacznika czasu dostają
+    # wspólny czas przyjęcia partii
+    now = datetime.utcnow()
+    return [
+        {
+            "measurement": metric.name,
+            "tags": metric.tags or {},
+            "fields": {"value": metric.value},
+            "time": metric.timestamp or now
+        }
+        for metric in metrics
+    ]
 
 async def store_metrics(metrics: List[Dict[str, Any]]):
-    """Zapisanie metryk w InfluxDB"""
-    try:
-        await influx_storage.write_metrics(metrics)
-        logger.info(f"Stored {len(metrics)} metrics")
-    except Exception as e:
-        logger.error(f"Error storing metrics: {e}")
+    """Przekazanie metryk do bufora zapisu InfluxDB"""
+    for metric in metrics:
+        write_buffer.put_nowait(metric)
+
+async def write_buffer_task():
+    """Zapis zbuforowanych metryk do InfluxDB partiami (rozmiar lub czas)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await write_buffer.get()]
+        deadline = loop.time() + WRITE_BATCH_INTERVAL
+        
+        while len(batch) < WRITE_BATCH_MAX:
+            try:
+                batch.append(write_buffer.get_nowait())
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(write_buffer.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+        
+        try:
+            await influx_storage.write_metrics(batch)
+            logger.info(f"Stored {len(batch)} metrics")
+        except Exception as e:
+            logger.error(f"Error storing metrics: {e}")
+        finally:
+            for _ in batch:
+                write_buffer.task_done()
 
 async def broadcast_metrics(metrics: List[Dict[str, Any]]):
-    """Wysłanie metryk do wszystkich aktywnych połączeń WebSocket"""
-    if not active_connections:
-        return
-    
+    """Publikacja metryk do połączeń WebSocket wszystkich workerów"""
     message = {
         "type": "metrics",
         "data": metrics,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": utc_timestamp()
     }
     
-    disconnected = []
-    for connection in active_connections:
+    try:
+        await broadcast_redis.publish(BROADCAST_CHANNEL, orjson.dumps(message))
+    except redis.RedisError as e:
+        logger.error(f"Error publishing metrics: {e}")
+
+async def broadcast_relay_task():
+    """Przekazywanie metryk z kanału broadcast do lokalnych połączeń WebSocket"""
+    while True:
         try:
-            await connection.send_text(json.dumps(message))
-        except:
-            disconnected.append(connection)
-    
-    # Usunięcie nieaktywnych połączeń
-    for connection in disconnected:
-        active_connections.remove(connection)
+            async with broadcast_redis.pubsub() as pubsub:
+                await pubsub.subscribe(BROADCAST_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message" and active_connections:
+                        send_to_connections(message["data"])
+        
+        except redis.RedisError as e:
+            logger.error(f"Broadcast relay error: {e}")
+            await asyncio.sleep(5)  # Oczekiwanie przed ponownym połączeniem
+
+def send_to_connections(data: bytes):
+    """Przekazanie wiadomości do kolejek połączeń WebSocket tego workera"""
+    payload = data.decode()
+    message = orjson.loads(data)
+    connections = list(active_connections)
+    blob = None
+    if any(connection.compressed for connection in connections):
+        blob = zstd_compressor.compress(data)
+    for connection in connections:
+        connection.send(payload, message, blob)
+
+async def connection_reaper_task():
+    """Zamykanie nieaktywnych połączeń WebSocket"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(WS_REAP_INTERVAL)
+        deadline = loop.time() - WS_IDLE_TIMEOUT
+        for connection in list(active_connections):
+            if connection.last_seen < deadline:
+                logger.info("Closing idle WebSocket connection")
+                connection.disconnect(code=1001)
 
 async def collect_from_source(source_type: str):
     """Zbieranie metryk z określonego źródła"""
@@ -345,25 +555,51 @@ async def periodic_collection_task():
     """Zadanie okresowego zbierania metryk"""
     while True:
         try:
-            for source_type, collector in collectors.items():
-                if collector.is_configured() and collector.is_auto_collection_enabled():
-                    await collect_from_source(source_type)
+            # Zbieranie ze wszystkich źródeł równolegle - czas cyklu to czas
+            # najwolniejszego źródła, a nie suma wszystkich
+            source_types = [
+                source_type for source_type, collector in collectors.items()
+                if collector.is_configured() and collector.is_auto_collection_enabled()
+            ]
+            results = await asyncio.gather(
+                *[collect_from_source(source_type) for source_type in source_types],
+                return_exceptions=True
+            )
+            
+            for source_type, result in zip(source_types, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error collecting from {source_type}: {result}")
             
             # Oczekiwanie przed następnym cyklem
-            await asyncio.sleep(settings.COLLECTION_INTERVAL)
+            await asyncio.sleep(settings.collection_interval)
             
         except Exception as e:
             logger.error(f"Error in periodic collection: {e}")
             await asyncio.sleep(60)  # Oczekiwanie przed ponowną próbą
 
+# Stały początek zapytań Flux, wyliczany raz przy starcie
+INFLUX_QUERY_PREFIX = f'from(bucket: "{settings.influxdb_bucket}")'
+
 def build_influx_query(source, metric_name, start_time, end_time, tags, limit):
     """Budowanie zapytania InfluxDB"""
-    query = f'from(bucket: "{settings.INFLUX_BUCKET}")'
+    return _build_influx_query(
+        source,
+        metric_name,
+        start_time.isoformat() if start_time else None,
+        end_time.isoformat() if end_time else None,
+        tags,
+        limit
+    )
+
+@lru_cache(maxsize=4096)
+def _build_influx_query(source, metric_name, start_time, end_time, tags, limit):
+    """Składanie zapytania Flux, zapamiętywane dla powtarzających się parametrów"""
+    query = INFLUX_QUERY_PREFIX
     
     if start_time:
-        query += f' |> range(start: {start_time.isoformat()}Z'
+        query += f' |> range(start: {start_time}Z'
         if end_time:
-            query += f', stop: {end_time.isoformat()}Z'
+            query += f', stop: {end_time}Z'
         query += ')'
     else:
         query += ' |> range(start: -1h)'
@@ -376,10 +612,9 @@ def build_influx_query(source, metric_name, start_time, end_time, tags, limit):
     
     if tags:
         # Parsowanie tagów (format: key1=value1,key2=value2)
-        tag_filters = tags.split(',')
-        for tag_filter in tag_filters:
-            if '=' in tag_filter:
-                key, value = tag_filter.split('=', 1)
+        for tag_filter in tags.split(','):
+            key, separator, value = tag_filter.partition('=')
+            if separator:
                 query += f' |> filter(fn: (r) => r.{key} == "{value}")'
     
     query += f' |> limit(n: {limit})'
@@ -406,17 +641,23 @@ async def apply_stream_filters(websocket: WebSocket, filters: Dict[str, Any]):
     """Aplikacja filtrów do streamingu"""
     # Implementacja filtrowania w czasie rzeczywistym
     # Na razie wysyłamy potwierdzenie
-    await websocket.send_text(json.dumps({
+    await websocket.send_text(orjson.dumps({
         "type": "filters_applied",
         "filters": filters,
-        "timestamp": datetime.utcnow().isoformat()
-    }))
+        "timestamp": utc_timestamp()
+    }).decode())
 
 if __name__ == "__main__":
+    # Jeden worker na każdy CPU dostępny dla procesu (z uwzględnieniem limitów
+    # cgroup/affinity), z możliwością nadpisania przez WEB_CONCURRENCY
+    workers = int(os.getenv("WEB_CONCURRENCY", len(os.sched_getaffinity(0))))
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=int(os.getenv("PORT", 8002)),
-        reload=True
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        ws_per_message_deflate=False
     )
 
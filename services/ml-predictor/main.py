@@ -4,26 +4,36 @@ CloudWatch Pro - ML Predictor Service
 
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from enum import Enum
+from contextlib import asynccontextmanager
 import logging
+import os
+import time
 import uvicorn
-import redis
-import json
+import redis.asyncio as redis
+import orjson
 import numpy as np
-import random
-import math
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release the Redis connection pool on shutdown"""
+    yield
+    await redis_pool.aclose()
+
 app = FastAPI(
     title="CloudWatch Pro - ML Predictor",
     description="Machine learning predictions for infrastructure metrics",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -34,8 +44,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shared generator for all simulated values
+rng = np.random.default_rng()
+
 # Redis client
-redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
+redis_pool = redis.ConnectionPool(host='redis', port=6379, db=0, max_connections=64, decode_responses=True)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Predictions are refreshed hourly (see next_update), so stored ones expire
+# with the same period; predictions:by_time indexes the live ones by creation
+PREDICTION_TTL = 3600
 
 class PredictionType(str, Enum):
     RESOURCE_USAGE = "resource_usage"
@@ -96,11 +114,21 @@ class CapacityPlanningResult(BaseModel):
     recommended_scaling: List[Dict[str, Any]]
     cost_impact: float
 
+# Most anomalies reported per detection
+ANOMALY_TOP_K = 3
+
+def anomaly_scores(values: np.ndarray) -> np.ndarray:
+    """Absolute z-score of each sample within its window"""
+    std = values.std() if values.size > 1 else 0
+    if std == 0:
+        return np.zeros_like(values)
+    return np.abs((values - values.mean()) / std)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
-        redis_client.ping()
+        await redis_client.ping()
         return {"status": "healthy", "service": "ml-predictor", "timestamp": datetime.utcnow()}
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -110,55 +138,78 @@ async def health_check():
 async def predict_metrics(request: PredictionRequest):
     """Predict future metric values using ML models"""
     try:
-        prediction_id = f"pred_{random.randint(100000, 999999)}"
+        prediction_id = f"pred_{rng.integers(100000, 1000000)}"
         
         # Simulate ML prediction (in real implementation, would use trained models)
-        predictions = []
-        base_value = random.uniform(30, 80)  # Base metric value
+        base_value = rng.uniform(30, 80)  # Base metric value
+        horizon = request.prediction_horizon
         
-        for i in range(request.prediction_horizon):
-            # Simulate time series prediction with trend and seasonality
-            time_factor = i / request.prediction_horizon
-            trend = base_value * (1 + 0.1 * time_factor)  # Linear trend
-            seasonal = 10 * math.sin(2 * math.pi * i / 24)  # Daily seasonality
-            noise = random.uniform(-5, 5)  # Random noise
-            
-            predicted_value = max(0, min(100, trend + seasonal + noise))
-            
-            # Calculate confidence intervals
-            confidence_margin = (1 - request.confidence_level) * 20
-            lower_bound = max(0, predicted_value - confidence_margin)
-            upper_bound = min(100, predicted_value + confidence_margin)
-            
-            predictions.append({
-                "timestamp": (datetime.utcnow() + timedelta(hours=i+1)).isoformat(),
-                "predicted_value": round(predicted_value, 2),
-                "lower_bound": round(lower_bound, 2),
-                "upper_bound": round(upper_bound, 2),
+        # Simulate time series prediction with trend and seasonality, for the
+        # whole horizon at once
+        steps = np.arange(horizon)
+        trend = base_value * (1 + 0.1 * steps / horizon)  # Linear trend
+        seasonal = 10 * np.sin(2 * np.pi * steps / 24)  # Daily seasonality
+        noise = rng.uniform(-5, 5, size=horizon)  # Random noise
+        
+        predicted_values = np.clip(trend + seasonal + noise, 0, 100)
+        
+        # Calculate confidence intervals
+        confidence_margin = (1 - request.confidence_level) * 20
+        lower_bounds = np.maximum(0, predicted_values - confidence_margin)
+        upper_bounds = np.minimum(100, predicted_values + confidence_margin)
+        
+        timestamps = np.datetime_as_string(np.datetime64(datetime.utcnow(), "us") + (steps + 1) * np.timedelta64(1, "h"))
+        
+        predictions = [
+            {
+                "timestamp": timestamp,
+                "predicted_value": predicted_value,
+                "lower_bound": lower_bound,
+                "upper_bound": upper_bound,
                 "confidence": request.confidence_level
-            })
+            }
+            for timestamp, predicted_value, lower_bound, upper_bound in zip(
+                timestamps.tolist(),
+                predicted_values.round(2).tolist(),
+                lower_bounds.round(2).tolist(),
+                upper_bounds.round(2).tolist()
+            )
+        ]
             
         # Store prediction in Redis for caching
         prediction_data = {
             "prediction_id": prediction_id,
             "metric_type": request.metric_type.value,
             "resource_id": request.resource_id,
-            "predictions": json.dumps(predictions),
+            "predictions": orjson.dumps(predictions),
             "created_at": datetime.utcnow().isoformat()
         }
-        redis_client.hset(f"prediction:{prediction_id}", mapping=prediction_data)
         
-        return PredictionResult(
+        # Store, expire and index the prediction in a single round trip
+        key = f"prediction:{prediction_id}"
+        created = time.time()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=prediction_data)
+            pipe.expire(key, PREDICTION_TTL)
+            pipe.zadd("predictions:by_time", {prediction_id: created})
+            pipe.zremrangebyscore("predictions:by_time", "-inf", created - PREDICTION_TTL)
+            await pipe.execute()
+        
+        result = PredictionResult(
             prediction_id=prediction_id,
             metric_type=request.metric_type,
             resource_id=request.resource_id,
             timestamp=datetime.utcnow(),
             predictions=predictions,
             confidence_level=request.confidence_level,
-            model_accuracy=random.uniform(0.85, 0.95),
+            model_accuracy=float(rng.uniform(0.85, 0.95)),
             next_update=datetime.utcnow() + timedelta(hours=1)
         )
         
+        # Already validated on construction; serialize once instead of letting
+        # the response_model re-validate and re-encode the prediction list
+        return Response(content=result.model_dump_json(), media_type="application/json")
+        
     except Exception as e:
         logger.error(f"Error predicting metrics: {e}")
         raise HTTPException(status_code=500, detail="Failed to predict metrics")
@@ -167,28 +218,39 @@ async def predict_metrics(request: PredictionRequest):
 async def detect_anomalies(request: AnomalyDetectionRequest):
     """Detect anomalies in metric data using ML algorithms"""
     try:
-        detection_id = f"anom_{random.randint(100000, 999999)}"
+        detection_id = f"anom_{rng.integers(100000, 1000000)}"
         
-        # Simulate anomaly detection
-        anomalies = []
+        # Simulate the metric window (hourly samples) with a few injected spikes
         threshold = 2.5 * request.sensitivity  # Anomaly threshold
+        window = request.time_window
+        values = rng.normal(45, 8, size=window)
+        spikes = rng.choice(window, size=min(int(rng.integers(0, 4)), window), replace=False)
+        values[spikes] = rng.uniform(80, 100, size=spikes.size)
         
-        # Generate some sample anomalies
-        num_anomalies = random.randint(0, 3)
-        for i in range(num_anomalies):
-            anomaly_time = datetime.utcnow() - timedelta(hours=random.randint(1, request.time_window))
-            anomaly_score = random.uniform(threshold, threshold + 2)
-            
-            anomalies.append({
-                "timestamp": anomaly_time.isoformat(),
-                "value": random.uniform(80, 100),
-                "expected_value": random.uniform(30, 60),
+        # Flag samples whose deviation exceeds the threshold, keeping the top K
+        scores = anomaly_scores(values)
+        flagged = np.flatnonzero(scores > threshold)
+        if flagged.size > ANOMALY_TOP_K:
+            flagged = flagged[np.argpartition(-scores[flagged], ANOMALY_TOP_K)[:ANOMALY_TOP_K]]
+        flagged = flagged[np.argsort(-scores[flagged])]
+        
+        expected_value = float(values.mean()) if flagged.size else 0.0
+        now = datetime.utcnow()
+        anomalies = [
+            {
+                "timestamp": (now - timedelta(hours=window - index)).isoformat(),
+                "value": value,
+                "expected_value": expected_value,
                 "anomaly_score": round(anomaly_score, 2),
                 "severity": "high" if anomaly_score > threshold + 1 else "medium",
                 "description": f"Unusual {request.metric_type.value} pattern detected"
-            })
-            
-        overall_anomaly_score = max([a["anomaly_score"] for a in anomalies]) if anomalies else 0
+            }
+            for index, value, anomaly_score in zip(
+                flagged.tolist(), values[flagged].tolist(), scores[flagged].tolist()
+            )
+        ]
+        
+        overall_anomaly_score = float(scores[flagged].max()) if flagged.size else 0
         
         return AnomalyResult(
             detection_id=detection_id,
@@ -208,50 +270,67 @@ async def detect_anomalies(request: AnomalyDetectionRequest):
 async def plan_capacity(request: CapacityPlanningRequest):
     """Generate capacity planning recommendations"""
     try:
-        planning_id = f"cap_{random.randint(100000, 999999)}"
+        planning_id = f"cap_{rng.integers(100000, 1000000)}"
         
         # Calculate growth rate if not provided
         if request.growth_rate is None:
-            request.growth_rate = random.uniform(0.05, 0.15)  # 5-15% monthly growth
+            request.growth_rate = float(rng.uniform(0.05, 0.15))  # 5-15% monthly growth
             
-        current_capacity = request.current_usage / request.target_utilization
+        initial_capacity = request.current_usage / request.target_utilization
         
-        # Project demand over planning horizon
-        projected_demand = []
-        recommended_scaling = []
+        # Project demand over planning horizon, one sample per week
+        weeks = np.arange(0, request.planning_horizon, 7)
+        growth_factors = (1 + request.growth_rate) ** (weeks / 30)  # Monthly growth
+        projected_usage = request.current_usage * growth_factors
+        capacity_needed = projected_usage / request.target_utilization
         
-        for week in range(0, request.planning_horizon, 7):
-            # Calculate projected usage
-            growth_factor = (1 + request.growth_rate) ** (week / 30)  # Monthly growth
-            projected_usage = request.current_usage * growth_factor
-            
-            # Determine if scaling is needed
-            utilization = projected_usage / current_capacity
-            
-            projected_demand.append({
-                "week": week // 7 + 1,
-                "date": (datetime.utcnow() + timedelta(days=week)).strftime("%Y-%m-%d"),
-                "projected_usage": round(projected_usage, 2),
-                "utilization": round(utilization * 100, 1),
-                "capacity_needed": round(projected_usage / request.target_utilization, 2)
-            })
-            
-            # Recommend scaling if utilization exceeds target
-            if utilization > request.target_utilization:
-                new_capacity = projected_usage / request.target_utilization
-                scaling_factor = new_capacity / current_capacity
-                
-                recommended_scaling.append({
-                    "week": week // 7 + 1,
-                    "date": (datetime.utcnow() + timedelta(days=week)).strftime("%Y-%m-%d"),
-                    "action": "scale_up",
-                    "current_capacity": round(current_capacity, 2),
-                    "recommended_capacity": round(new_capacity, 2),
-                    "scaling_factor": round(scaling_factor, 2),
-                    "urgency": "high" if utilization > 0.9 else "medium"
-                })
-                
-                current_capacity = new_capacity
+        # Scaling up only ever raises capacity to what a week needs, so the
+        # capacity in force each week is a running maximum of earlier needs
+        capacity_after = np.maximum.accumulate(np.maximum(capacity_needed, initial_capacity))
+        capacity_before = np.concatenate(([initial_capacity], capacity_after[:-1]))
+        utilization = projected_usage / capacity_before
+        
+        # Recommend scaling if utilization exceeds target
+        scale_weeks = utilization > request.target_utilization
+        
+        week_numbers = (weeks // 7 + 1).tolist()
+        dates = np.datetime_as_string(np.datetime64(datetime.utcnow().date()) + weeks).tolist()
+        
+        projected_demand = [
+            {
+                "week": week_number,
+                "date": date,
+                "projected_usage": usage,
+                "utilization": util,
+                "capacity_needed": needed
+            }
+            for week_number, date, usage, util, needed in zip(
+                week_numbers,
+                dates,
+                projected_usage.round(2).tolist(),
+                (utilization * 100).round(1).tolist(),
+                capacity_needed.round(2).tolist()
+            )
+        ]
+        
+        scaling_factors = capacity_needed[scale_weeks] / capacity_before[scale_weeks]
+        recommended_scaling = [
+            {
+                "week": week_numbers[index],
+                "date": dates[index],
+                "action": "scale_up",
+                "current_capacity": round(current, 2),
+                "recommended_capacity": round(new, 2),
+                "scaling_factor": round(factor, 2),
+                "urgency": "high" if utilization[index] > 0.9 else "medium"
+            }
+            for index, current, new, factor in zip(
+                np.flatnonzero(scale_weeks).tolist(),
+                capacity_before[scale_weeks].tolist(),
+                capacity_needed[scale_weeks].tolist(),
+                scaling_factors.tolist()
+            )
+        ]
                 
         # Calculate cost impact (simplified)
         total_scaling = sum([s["scaling_factor"] - 1 for s in recommended_scaling])
@@ -260,7 +339,7 @@ async def plan_capacity(request: CapacityPlanningRequest):
         return CapacityPlanningResult(
             planning_id=planning_id,
             resource_type=request.resource_type,
-            current_capacity=round(request.current_usage / request.target_utilization, 2),
+            current_capacity=round(initial_capacity, 2),
             projected_demand=projected_demand,
             recommended_scaling=recommended_scaling,
             cost_impact=round(cost_impact, 2)
@@ -319,7 +398,7 @@ async def get_model_status():
 async def get_prediction(prediction_id: str):
     """Get stored prediction by ID"""
     try:
-        prediction_data = redis_client.hgetall(f"prediction:{prediction_id}")
+        prediction_data = await redis_client.hgetall(f"prediction:{prediction_id}")
         if not prediction_data:
             raise HTTPException(status_code=404, detail="Prediction not found")
             
@@ -327,7 +406,7 @@ async def get_prediction(prediction_id: str):
             "prediction_id": prediction_id,
             "metric_type": prediction_data["metric_type"],
             "resource_id": prediction_data["resource_id"],
-            "predictions": json.loads(prediction_data["predictions"]),
+            "predictions": orjson.loads(prediction_data["predictions"]),
             "created_at": prediction_data["created_at"]
         }
         
@@ -385,5 +464,15 @@ async def get_trend_insights():
         raise HTTPException(status_code=500, detail="Failed to get trend insights")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8005)
+    # One worker per CPU available to this process (honours cgroup/affinity
+    # limits), overridable with WEB_CONCURRENCY
+    workers = int(os.getenv("WEB_CONCURRENCY", len(os.sched_getaffinity(0))))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8005,
+        workers=workers,
+        loop="uvloop",
+        http="httptools"
+    )
 
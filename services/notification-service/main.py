@@ -2,27 +2,40 @@
 CloudWatch Pro - Notification Service
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
+from contextlib import asynccontextmanager
 import logging
 import uvicorn
-import redis
-import json
+import redis.asyncio as redis
+import orjson
 import uuid
+import time
+import os
 import asyncio
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release the Redis connection pool on shutdown"""
+    yield
+    await redis_pool.aclose()
+
 app = FastAPI(
     title="CloudWatch Pro - Notification Service",
     description="Notification and alerting service",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -33,8 +46,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large notification listings; small responses aren't worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=5)
+
 # Redis client
-redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
+redis_pool = redis.ConnectionPool(host='redis', port=6379, db=0, max_connections=64, decode_responses=True)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Notification records are kept for a week
+NOTIFICATION_TTL = 7 * 24 * 3600
+
+# Last formatted timestamp: (epoch second, ISO 8601 text)
+_ts_cache = (0, "")
+
+def utc_timestamp() -> str:
+    """Current UTC time in ISO 8601, formatted at most once per second"""
+    global _ts_cache
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache = (now, datetime.utcfromtimestamp(now).isoformat())
+    return _ts_cache[1]
+
+# Hash fields returned by the list endpoint ("type" is always set)
+NOTIFICATION_LIST_FIELDS = ("type", "recipient", "subject", "status", "priority", "created_at", "sent_at")
 
 class NotificationType(str, Enum):
     EMAIL = "email"
@@ -67,13 +101,13 @@ class NotificationChannel(BaseModel):
 async def health_check():
     """Health check endpoint"""
     try:
-        redis_client.ping()
+        await redis_client.ping()
         return {"status": "healthy", "service": "notification-service", "timestamp": datetime.utcnow()}
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail="Service unhealthy")
 
-@app.post("/send")
+@app.post("/send", status_code=202)
 async def send_notification(
     notification: NotificationRequest,
     background_tasks: BackgroundTasks
@@ -90,13 +124,22 @@ async def send_notification(
             "subject": notification.subject,
             "message": notification.message,
             "priority": notification.priority.value,
-            "metadata": json.dumps(notification.metadata),
+            "metadata": orjson.dumps(notification.metadata),
             "status": "pending",
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": utc_timestamp()
         }
         
-        redis_client.hset(f"notification:{notification_id}", mapping=notification_data)
-        redis_client.sadd("notifications", notification_id)
+        # Hash stored, expired and indexed in one round trip; the index is a
+        # sorted set scored by creation time so listing can fetch just the
+        # newest ids, trimmed to the entries that haven't expired yet
+        key = f"notification:{notification_id}"
+        created = time.time()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=notification_data)
+            pipe.expire(key, NOTIFICATION_TTL)
+            pipe.zadd("notifications:by_time", {notification_id: created})
+            pipe.zremrangebyscore("notifications:by_time", "-inf", created - NOTIFICATION_TTL)
+            await pipe.execute()
         
         # Send notification in background
         background_tasks.add_task(
@@ -105,11 +148,16 @@ async def send_notification(
             notification
         )
         
-        return {
-            "notification_id": notification_id,
-            "status": "queued",
-            "message": "Notification queued for delivery"
-        }
+        # Fixed-shape body, encoded directly instead of through FastAPI's serializer
+        return Response(
+            content=orjson.dumps({
+                "notification_id": notification_id,
+                "status": "queued",
+                "message": "Notification queued for delivery"
+            }),
+            media_type="application/json",
+            status_code=202
+        )
         
     except Exception as e:
         logger.error(f"Error sending notification: {e}")
@@ -124,11 +172,11 @@ async def process_notification(notification_id: str, notification: NotificationR
         await asyncio.sleep(2)
         
         # Update status
-        redis_client.hset(
+        await redis_client.hset(
             f"notification:{notification_id}",
             mapping={
                 "status": "sent",
-                "sent_at": datetime.utcnow().isoformat()
+                "sent_at": utc_timestamp()
             }
         )
         
@@ -136,42 +184,52 @@ async def process_notification(notification_id: str, notification: NotificationR
         
     except Exception as e:
         logger.error(f"Failed to process notification {notification_id}: {e}")
-        redis_client.hset(
+        await redis_client.hset(
             f"notification:{notification_id}",
             mapping={
                 "status": "failed",
                 "error": str(e),
-                "failed_at": datetime.utcnow().isoformat()
+                "failed_at": utc_timestamp()
             }
         )
 
 @app.get("/notifications")
-async def list_notifications(limit: int = 100):
+async def list_notifications(limit: int = Query(100, ge=1, le=1000)):
     """List notifications"""
     try:
-        notification_ids = list(redis_client.smembers("notifications"))[:limit]
+        notification_ids = await redis_client.zrevrange("notifications:by_time", 0, limit - 1)
         notifications = []
         
-        for notification_id in notification_ids:
-            notification_data = redis_client.hgetall(f"notification:{notification_id}")
-            if notification_data:
+        # Fetch the listed fields of every hash in a single round trip; the
+        # message body and metadata blob are never transferred or decoded
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for notification_id in notification_ids:
+                pipe.hmget(f"notification:{notification_id}", NOTIFICATION_LIST_FIELDS)
+            results = await pipe.execute()
+        
+        for notification_id, values in zip(notification_ids, results):
+            if values[0] is not None:
                 notifications.append({
                     "notification_id": notification_id,
-                    "type": notification_data["type"],
-                    "recipient": notification_data["recipient"],
-                    "subject": notification_data["subject"],
-                    "status": notification_data["status"],
-                    "priority": notification_data["priority"],
-                    "created_at": notification_data["created_at"],
-                    "sent_at": notification_data.get("sent_at")
+                    **dict(zip(NOTIFICATION_LIST_FIELDS, values))
                 })
                 
-        return {"notifications": notifications}
+        return ORJSONResponse(content={"notifications": notifications})
         
     except Exception as e:
         logger.error(f"Error listing notifications: {e}")
         raise HTTPException(status_code=500, detail="Failed to list notifications")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8007)
+    # One worker per CPU available to this process (honours cgroup/affinity
+    # limits), overridable with WEB_CONCURRENCY
+    workers = int(os.getenv("WEB_CONCURRENCY", len(os.sched_getaffinity(0))))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8007,
+        workers=workers,
+        loop="uvloop",
+        http="httptools"
+    )
 
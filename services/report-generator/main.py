@@ -2,28 +2,44 @@
 CloudWatch Pro - Report Generator Service
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from enum import Enum
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
 import logging
 import uvicorn
-import redis
-import json
+import redis.asyncio as redis
+import orjson
 import uuid
+import time
 import os
+import asyncio
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the report workers; release them and the Redis connection pool on shutdown"""
+    global report_executor
+    report_executor = ProcessPoolExecutor(max_workers=REPORT_PROCESSES)
+    yield
+    report_executor.shutdown(wait=False, cancel_futures=True)
+    await redis_pool.aclose()
+
 app = FastAPI(
     title="CloudWatch Pro - Report Generator",
     description="Report generation and export service",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -34,8 +50,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON bodies and report downloads; small responses aren't worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=5)
+
 # Redis client
-redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
+redis_pool = redis.ConnectionPool(host='redis', port=6379, db=0, max_connections=64, decode_responses=True)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Report records are kept for a week
+REPORT_TTL = 7 * 24 * 3600
+
+# Worker processes for CPU-bound report rendering, per uvicorn worker. There
+# is already one uvicorn worker per CPU, so keep this small
+REPORT_PROCESSES = int(os.getenv("REPORT_PROCESSES", 1))
+report_executor: Optional[ProcessPoolExecutor] = None
+
+# Last formatted timestamp: (epoch second, ISO 8601 text)
+_ts_cache = (0, "")
+
+def utc_timestamp() -> str:
+    """Current UTC time in ISO 8601, formatted at most once per second"""
+    global _ts_cache
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache = (now, datetime.utcfromtimestamp(now).isoformat())
+    return _ts_cache[1]
+
+# Hash fields returned by the list endpoint ("name" is always set)
+REPORT_LIST_FIELDS = ("name", "type", "format", "status", "created_at", "completed_at")
 
 class ReportType(str, Enum):
     SYSTEM_HEALTH = "system_health"
@@ -63,13 +105,13 @@ class ReportRequest(BaseModel):
 async def health_check():
     """Health check endpoint"""
     try:
-        redis_client.ping()
+        await redis_client.ping()
         return {"status": "healthy", "service": "report-generator", "timestamp": datetime.utcnow()}
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail="Service unhealthy")
 
-@app.post("/generate")
+@app.post("/generate", status_code=202)
 async def generate_report(
     report_request: ReportRequest,
     background_tasks: BackgroundTasks
@@ -86,14 +128,23 @@ async def generate_report(
             "format": report_request.format.value,
             "start_date": report_request.start_date.isoformat(),
             "end_date": report_request.end_date.isoformat(),
-            "filters": json.dumps(report_request.filters),
-            "recipients": json.dumps(report_request.recipients),
+            "filters": orjson.dumps(report_request.filters),
+            "recipients": orjson.dumps(report_request.recipients),
             "status": "generating",
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": utc_timestamp()
         }
         
-        redis_client.hset(f"report:{report_id}", mapping=report_data)
-        redis_client.sadd("reports", report_id)
+        # Hash stored, expired and indexed in one round trip; the index is a
+        # sorted set scored by creation time so listing can fetch just the
+        # newest ids, trimmed to the entries that haven't expired yet
+        key = f"report:{report_id}"
+        created = time.time()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=report_data)
+            pipe.expire(key, REPORT_TTL)
+            pipe.zadd("reports:by_time", {report_id: created})
+            pipe.zremrangebyscore("reports:by_time", "-inf", created - REPORT_TTL)
+            await pipe.execute()
         
         # Generate report in background
         background_tasks.add_task(
@@ -102,43 +153,55 @@ async def generate_report(
             report_request
         )
         
-        return {
-            "report_id": report_id,
-            "status": "generating",
-            "message": "Report generation started"
-        }
+        # Fixed-shape body, encoded directly instead of through FastAPI's serializer
+        return Response(
+            content=orjson.dumps({
+                "report_id": report_id,
+                "status": "generating",
+                "message": "Report generation started"
+            }),
+            media_type="application/json",
+            status_code=202
+        )
         
     except Exception as e:
         logger.error(f"Error generating report: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate report")
 
+def render_report(report_id: str, report_request: ReportRequest) -> str:
+    """Render the report file and return its path (runs in a worker process)"""
+    # Create dummy report file
+    os.makedirs("/tmp/reports", exist_ok=True)
+    file_path = f"/tmp/reports/{report_id}.{report_request.format.value}"
+    
+    with open(file_path, "w") as f:
+        f.write(f"CloudWatch Pro Report\n")
+        f.write(f"Report ID: {report_id}\n")
+        f.write(f"Type: {report_request.type.value}\n")
+        f.write(f"Generated: {datetime.utcnow()}\n")
+        f.write(f"Period: {report_request.start_date} to {report_request.end_date}\n")
+    
+    return file_path
+
 async def process_report_generation(report_id: str, report_request: ReportRequest):
     """Process report generation (background task)"""
     try:
         logger.info(f"Generating report {report_id}")
         
         # Simulate report generation
-        import time
-        time.sleep(5)  # Simulate processing time
-        
-        # Create dummy report file
-        os.makedirs("/tmp/reports", exist_ok=True)
-        file_path = f"/tmp/reports/{report_id}.{report_request.format.value}"
+        await asyncio.sleep(5)  # Simulate processing time
         
-        with open(file_path, "w") as f:
-            f.write(f"CloudWatch Pro Report\n")
-            f.write(f"Report ID: {report_id}\n")
-            f.write(f"Type: {report_request.type.value}\n")
-            f.write(f"Generated: {datetime.utcnow()}\n")
-            f.write(f"Period: {report_request.start_date} to {report_request.end_date}\n")
+        # Render in a worker process so rendering never blocks the event loop
+        loop = asyncio.get_running_loop()
+        file_path = await loop.run_in_executor(report_executor, render_report, report_id, report_request)
         
         # Update status
-        redis_client.hset(
+        await redis_client.hset(
             f"report:{report_id}",
             mapping={
                 "status": "completed",
                 "file_path": file_path,
-                "completed_at": datetime.utcnow().isoformat()
+                "completed_at": utc_timestamp()
             }
         )
         
@@ -146,36 +209,37 @@ async def process_report_generation(report_id: str, report_request: ReportReques
         
     except Exception as e:
         logger.error(f"Failed to generate report {report_id}: {e}")
-        redis_client.hset(
+        await redis_client.hset(
             f"report:{report_id}",
             mapping={
                 "status": "failed",
                 "error": str(e),
-                "failed_at": datetime.utcnow().isoformat()
+                "failed_at": utc_timestamp()
             }
         )
 
 @app.get("/reports")
-async def list_reports(limit: int = 100):
+async def list_reports(limit: int = Query(100, ge=1, le=1000)):
     """List reports"""
     try:
-        report_ids = list(redis_client.smembers("reports"))[:limit]
+        report_ids = await redis_client.zrevrange("reports:by_time", 0, limit - 1)
         reports = []
         
-        for report_id in report_ids:
-            report_data = redis_client.hgetall(f"report:{report_id}")
-            if report_data:
+        # Fetch the listed fields of every hash in a single round trip; the
+        # filters and recipients blobs are never transferred or decoded
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for report_id in report_ids:
+                pipe.hmget(f"report:{report_id}", REPORT_LIST_FIELDS)
+            results = await pipe.execute()
+        
+        for report_id, values in zip(report_ids, results):
+            if values[0] is not None:
                 reports.append({
                     "report_id": report_id,
-                    "name": report_data["name"],
-                    "type": report_data["type"],
-                    "format": report_data["format"],
-                    "status": report_data["status"],
-                    "created_at": report_data["created_at"],
-                    "completed_at": report_data.get("completed_at")
+                    **dict(zip(REPORT_LIST_FIELDS, values))
                 })
                 
-        return {"reports": reports}
+        return ORJSONResponse(content={"reports": reports})
         
     except Exception as e:
         logger.error(f"Error listing reports: {e}")
@@ -185,7 +249,7 @@ async def list_reports(limit: int = 100):
 async def download_report(report_id: str):
     """Download report file"""
     try:
-        report_data = redis_client.hgetall(f"report:{report_id}")
+        report_data = await redis_client.hgetall(f"report:{report_id}")
         if not report_data:
             raise HTTPException(status_code=404, detail="Report not found")
             
@@ -193,13 +257,21 @@ async def download_report(report_id: str):
             raise HTTPException(status_code=400, detail="Report not ready for download")
             
         file_path = report_data.get("file_path")
-        if not file_path or not os.path.exists(file_path):
+        try:
+            # A single stat both checks the file exists and is handed to
+            # FileResponse so it doesn't stat again; the body is sent in chunks
+            stat_result = os.stat(file_path) if file_path else None
+        except FileNotFoundError:
+            stat_result = None
+        if stat_result is None:
             raise HTTPException(status_code=404, detail="Report file not found")
             
         return FileResponse(
             path=file_path,
             filename=f"{report_data['name']}.{report_data['format']}",
-            media_type="application/octet-stream"
+            media_type="application/octet-stream",
+            stat_result=stat_result,
+            method="GET"
         )
         
     except HTTPException:
@@ -209,5 +281,15 @@ async def download_report(report_id: str):
         raise HTTPException(status_code=500, detail="Failed to download report")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8008)
+    # One worker per CPU available to this process (honours cgroup/affinity
+    # limits), overridable with WEB_CONCURRENCY
+    workers = int(os.getenv("WEB_CONCURRENCY", len(os.sched_getaffinity(0))))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8008,
+        workers=workers,
+        loop="uvloop",
+        http="httptools"
+    )
 
@@ -2,84 +2,228 @@
 Moduł uwierzytelniania i autoryzacji dla User Service
 """
 
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from datetime import timedelta
+from typing import Optional, Dict, Any, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
+import jwt
+from jwt.exceptions import InvalidTokenError as JWTError
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
-import redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import redis.asyncio as redis
+import time
+import asyncio
+import logging
+import base64
+import hmac
+from hashlib import blake2b, sha256, sha384, sha512
+import secrets
 import json
+from cachetools import TTLCache
 
 from database import get_db
 from models import User
 from config import settings
 
-# Konfiguracja hashowania haseł
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Konfiguracja hashowania haseł - argon2id z parametrami dobranymi pod czas
+# logowania; bcrypt zostaje tylko do weryfikacji istniejących hashy
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1
+)
 
 # Konfiguracja security
 security = HTTPBearer()
 
-# Połączenie z Redis
-redis_client = redis.Redis(
+# Wystawca i odbiorca tokenów dostępu, sprawdzani przy weryfikacji
+TOKEN_ISSUER = "cloudwatch-pro-user-service"
+TOKEN_AUDIENCE = "cloudwatch-pro"
+
+# Połączenie z Redis (asynchroniczne, ze wspólną pulą połączeń)
+redis_pool = redis.ConnectionPool(
     host=settings.REDIS_HOST,
     port=settings.REDIS_PORT,
     db=settings.REDIS_DB,
+    password=settings.REDIS_PASSWORD,
+    max_connections=64,
     decode_responses=True
 )
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+logger = logging.getLogger(__name__)
+
+# Zweryfikowane payloady tokenów (kluczem jest skrót tokenu), żeby kolejne
+# żądania z tym samym tokenem pomijały weryfikację podpisu i sprawdzenie
+# w Redis. Skrót unieważnionego tokenu jest ogłaszany na kanale
+# TOKEN_REVOKED_CHANNEL, żeby usunąć go z cache wszystkich workerów
+token_cache: TTLCache = TTLCache(maxsize=10000, ttl=60)
+TOKEN_REVOKED_CHANNEL = "auth:token_revoked"
+
+# Użytkownicy wczytani przez get_current_user, żeby endpointy tylko do odczytu
+# nie odpytywały bazy przy każdym żądaniu. Zmiana danych użytkownika jest
+# ogłaszana na kanale USER_UPDATED_CHANNEL
+user_cache: TTLCache = TTLCache(maxsize=5000, ttl=30)
+USER_UPDATED_CHANNEL = "auth:user_updated"
+
+# Zserializowane odpowiedzi /auth/me, unieważniane razem z user_cache
+profile_cache: TTLCache = TTLCache(maxsize=5000, ttl=30)
+
+# Niedawno poprawnie zweryfikowane hasła, żeby ponowienia logowania nie
+# uruchamiały ponownie KDF. Kluczem jest skrót (z losowym kluczem procesu)
+# zapisanego hasha i hasła, więc zmiana hasła unieważnia wpis
+password_cache: TTLCache = TTLCache(maxsize=1000, ttl=30)
+PASSWORD_CACHE_KEY = secrets.token_bytes(32)
+
+# Uprawnienia ról jako zbiory - budowane raz, sprawdzane w O(1) przy każdym żądaniu
+ROLE_PERMISSIONS: Dict[str, frozenset] = {
+    "viewer": frozenset({
+        "dashboards:read",
+        "alerts:read",
+        "reports:read"
+    }),
+    "user": frozenset({
+        "dashboards:read",
+        "dashboards:write",
+        "alerts:read",
+        "alerts:write",
+        "reports:read",
+        "reports:write",
+        "profile:write"
+    }),
+    "admin": frozenset({
+        "dashboards:read",
+        "dashboards:write",
+        "dashboards:delete",
+        "alerts:read",
+        "alerts:write",
+        "alerts:delete",
+        "reports:read",
+        "reports:write",
+        "reports:delete",
+        "users:read",
+        "users:write",
+        "organizations:read",
+        "organizations:write",
+        "config:read"
+    }),
+    "super_admin": frozenset({
+        "*"  # Wszystkie uprawnienia
+    })
+}
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Weryfikacja hasła (w puli wątków, żeby nie blokować pętli zdarzeń)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, pwd_context.verify, plain_password, hashed_password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Weryfikacja hasła zwracająca nowy hash, gdy zapisany używa przestarzałego schematu"""
+    cache_key = blake2b(
+        f"{hashed_password}:{plain_password}".encode(), key=PASSWORD_CACHE_KEY, digest_size=32
+    ).digest()
+    if cache_key in password_cache:
+        return True, None
+    
+    loop = asyncio.get_running_loop()
+    valid, new_hash = await loop.run_in_executor(
+        None, pwd_context.verify_and_update, plain_password, hashed_password
+    )
+    if valid and new_hash is None:
+        password_cache[cache_key] = True
+    return valid, new_hash
+
+async def get_password_hash(password: str) -> str:
+    """Hashowanie hasła (w puli wątków, żeby nie blokować pętli zdarzeń)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, pwd_context.hash, password)
+
+# Algorytmy HMAC podpisywane bez PyJWT - nagłówek jest stały dla całego
+# procesu, a klucz HMAC przygotowany raz, więc podpis tokenu sprowadza się
+# do zakodowania payloadu i jednego skrótu. JSON kodowany jak w PyJWT
+# (zwarte separatory, znaki spoza ASCII jako \uXXXX), więc tokeny są
+# bajt w bajt takie same jak z jwt.encode
+JWT_JSON_SEPARATORS = (",", ":")
+HMAC_DIGESTS = {"HS256": sha256, "HS384": sha384, "HS512": sha512}
+
+def b64url(data: bytes) -> bytes:
+    """Kodowanie base64url bez dopełnienia, jak w JWS"""
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+if settings.ALGORITHM in HMAC_DIGESTS:
+    TOKEN_HEADER_B64 = b64url(json.dumps({"alg": settings.ALGORITHM, "typ": "JWT"}, separators=JWT_JSON_SEPARATORS).encode())
+    TOKEN_HMAC = hmac.new(settings.SECRET_KEY.encode(), digestmod=HMAC_DIGESTS[settings.ALGORITHM])
+else:
+    TOKEN_HMAC = None
+
+def encode_token(claims: Dict[str, Any]) -> str:
+    """Podpisanie tokenu JWT (claims muszą być serializowalne do JSON)"""
+    if TOKEN_HMAC is None:
+        return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    signing_input = TOKEN_HEADER_B64 + b"." + b64url(json.dumps(claims, separators=JWT_JSON_SEPARATORS).encode())
+    mac = TOKEN_HMAC.copy()
+    mac.update(signing_input)
+    return (signing_input + b"." + b64url(mac.digest())).decode()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Weryfikacja hasła"""
-    return pwd_context.verify(plain_password, hashed_password)
+def token_digest(token: str) -> str:
+    """Skrót tokenu używany zamiast samego tokenu w cache, Redis i powiadomieniach"""
+    return blake2b(token.encode(), digest_size=16).hexdigest()
 
-def get_password_hash(password: str) -> str:
-    """Hashowanie hasła"""
-    return pwd_context.hash(password)
+def token_key(digest: str) -> str:
+    """Klucz Redis potwierdzający ważność tokenu o danym skrócie"""
+    return f"token:{digest}"
 
-def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
+async def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     """Tworzenie tokenu dostępu JWT"""
     to_encode = data.copy()
+    ttl = int(expires_delta.total_seconds()) if expires_delta else settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
     
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    
+    # Jeden odczyt zegara na token - iat i exp to sekundy epoki, bez datetime
+    now = int(time.time())
     to_encode.update({
-        "exp": expire,
-        "iat": datetime.utcnow(),
-        "iss": "cloudwatch-pro-user-service",
-        "aud": "cloudwatch-pro"
+        "exp": now + ttl,
+        "iat": now,
+        "iss": TOKEN_ISSUER,
+        "aud": TOKEN_AUDIENCE
     })
     
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    encoded_jwt = encode_token(to_encode)
     
-    # Zapisanie tokenu w Redis dla możliwości unieważnienia
-    token_key = f"token:{data.get('sub')}:{encoded_jwt[-10:]}"
-    redis_client.setex(
-        token_key,
-        int(expires_delta.total_seconds()) if expires_delta else settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        json.dumps(to_encode)
-    )
+    # Zapisanie tokenu w Redis dla możliwości unieważnienia - liczy się tylko
+    # istnienie klucza, więc wartość jest minimalna
+    await redis_client.setex(token_key(token_digest(encoded_jwt)), ttl, "1")
     
     return encoded_jwt
 
-def verify_token(token: str) -> Dict[str, Any]:
+async def verify_token(token: str) -> Dict[str, Any]:
     """Weryfikacja tokenu JWT"""
+    digest = token_digest(token)
+    cached = token_cache.get(digest)
+    if cached is not None and cached.get("exp", 0) > time.time():
+        return cached
+    
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = jwt.decode(
+            token,
+            settings.SECRET_KEY,
+            algorithms=[settings.ALGORITHM],
+            audience=TOKEN_AUDIENCE,
+            issuer=TOKEN_ISSUER
+        )
         
         # Sprawdzenie czy token nie został unieważniony
-        token_key = f"token:{payload.get('sub')}:{token[-10:]}"
-        if not redis_client.exists(token_key):
+        if not await redis_client.exists(token_key(digest)):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token has been revoked",
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
+        token_cache[digest] = payload
         return payload
     except JWTError:
         raise HTTPException(
@@ -88,23 +232,54 @@ def verify_token(token: str) -> Dict[str, Any]:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def revoke_token(token: str) -> bool:
+async def revoke_token(token: str) -> bool:
     """Unieważnienie tokenu"""
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        token_key = f"token:{payload.get('sub')}:{token[-10:]}"
-        return redis_client.delete(token_key) > 0
+        jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM], audience=TOKEN_AUDIENCE)
+        digest = token_digest(token)
+        token_cache.pop(digest, None)
+        await redis_client.publish(TOKEN_REVOKED_CHANNEL, digest)
+        return await redis_client.delete(token_key(digest)) > 0
     except JWTError:
         return False
 
-def get_current_user(
+async def invalidate_user_cache(user_id: str):
+    """Usunięcie użytkownika z cache we wszystkich workerach"""
+    user_cache.pop(user_id, None)
+    profile_cache.pop(user_id, None)
+    await redis_client.publish(USER_UPDATED_CHANNEL, user_id)
+
+async def cache_invalidation_listener():
+    """Usuwanie z lokalnych cache tokenów i użytkowników zmienionych w innych workerach"""
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(TOKEN_REVOKED_CHANNEL, USER_UPDATED_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    if message["channel"] == TOKEN_REVOKED_CHANNEL:
+                        token_cache.pop(message["data"], None)
+                    else:
+                        user_cache.pop(message["data"], None)
+                        profile_cache.pop(message["data"], None)
+        
+        except redis.RedisError as e:
+            logger.error(f"Cache invalidation listener error: {e}")
+            # Bez powiadomień cache mogłyby zwracać nieaktualne dane
+            token_cache.clear()
+            user_cache.clear()
+            profile_cache.clear()
+            await asyncio.sleep(5)
+
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Pobieranie aktualnie zalogowanego użytkownika"""
     
     token = credentials.credentials
-    payload = verify_token(token)
+    payload = await verify_token(token)
     
     user_id: str = payload.get("sub")
     if user_id is None:
@@ -114,13 +289,20 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = user_cache.get(user_id)
     if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalars().first()
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        # Do cache trafia odłączona kopia - zmiany wprowadzane w sesji żądania
+        # (np. w update_user_profile) nie przenikają do innych żądań
+        db.expunge(user)
+        user_cache[user_id] = user
     
     if not user.is_active:
         raise HTTPException(
@@ -154,6 +336,8 @@ def require_permissions(required_permissions: list):
     """Dekorator wymagający określonych uprawnień"""
     def permission_checker(current_user: User = Depends(get_current_user)) -> User:
         user_permissions = get_user_permissions(current_user)
+        if "*" in user_permissions:
+            return current_user
         
         for permission in required_permissions:
             if permission not in user_permissions:
@@ -164,61 +348,24 @@ def require_permissions(required_permissions: list):
         return current_user
     return permission_checker
 
-def get_user_permissions(user: User) -> list:
+def get_user_permissions(user: User) -> frozenset:
     """Pobieranie uprawnień użytkownika na podstawie roli"""
-    role_permissions = {
-        "viewer": [
-            "dashboards:read",
-            "alerts:read",
-            "reports:read"
-        ],
-        "user": [
-            "dashboards:read",
-            "dashboards:write",
-            "alerts:read",
-            "alerts:write",
-            "reports:read",
-            "reports:write",
-            "profile:write"
-        ],
-        "admin": [
-            "dashboards:read",
-            "dashboards:write",
-            "dashboards:delete",
-            "alerts:read",
-            "alerts:write",
-            "alerts:delete",
-            "reports:read",
-            "reports:write",
-            "reports:delete",
-            "users:read",
-            "users:write",
-            "organizations:read",
-            "organizations:write",
-            "config:read"
-        ],
-        "super_admin": [
-            "*"  # Wszystkie uprawnienia
-        ]
-    }
-    
-    return role_permissions.get(user.role, [])
+    return ROLE_PERMISSIONS.get(user.role, frozenset())
 
-def create_refresh_token(user_id: str) -> str:
+async def create_refresh_token(user_id: str) -> str:
     """Tworzenie refresh token"""
     data = {
         "sub": user_id,
         "type": "refresh"
     }
     
-    expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    data.update({"exp": expire})
+    data.update({"exp": int(time.time()) + settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60})
     
-    refresh_token = jwt.encode(data, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    refresh_token = encode_token(data)
     
     # Zapisanie refresh token w Redis
     refresh_key = f"refresh_token:{user_id}"
-    redis_client.setex(
+    await redis_client.setex(
         refresh_key,
         settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
         refresh_token
@@ -226,7 +373,7 @@ def create_refresh_token(user_id: str) -> str:
     
     return refresh_token
 
-def verify_refresh_token(refresh_token: str) -> str:
+async def verify_refresh_token(refresh_token: str) -> str:
     """Weryfikacja refresh token i zwrócenie user_id"""
     try:
         payload = jwt.decode(refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -246,7 +393,7 @@ def verify_refresh_token(refresh_token: str) -> str:
         
         # Sprawdzenie czy refresh token istnieje w Redis
         refresh_key = f"refresh_token:{user_id}"
-        stored_token = redis_client.get(refresh_key)
+        stored_token = await redis_client.get(refresh_key)
         
         if not stored_token or stored_token != refresh_token:
             raise HTTPException(
@@ -262,8 +409,8 @@ def verify_refresh_token(refresh_token: str) -> str:
             detail="Could not validate refresh token"
         )
 
-def revoke_refresh_token(user_id: str) -> bool:
+async def revoke_refresh_token(user_id: str) -> bool:
     """Unieważnienie refresh token"""
     refresh_key = f"refresh_token:{user_id}"
-    return redis_client.delete(refresh_key) > 0
+    return await redis_client.delete(refresh_key) > 0
 
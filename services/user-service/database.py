@@ -2,42 +2,73 @@
 Konfiguracja bazy danych dla User Service
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from typing import AsyncGenerator
+import logging
+import time
 import os
 
 from config import settings
 
-# Tworzenie silnika bazy danych
-engine = create_engine(
-    settings.DATABASE_URL,
+# Sterownik asyncpg - DATABASE_URL może pozostać w postaci postgresql://
+DATABASE_URL = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+# Tworzenie asynchronicznego silnika bazy danych
+engine = create_async_engine(
+    DATABASE_URL,
     pool_pre_ping=True,
-    pool_recycle=300,
-    pool_size=10,
-    max_overflow=20
+    pool_recycle=3600,
+    pool_size=20,
+    max_overflow=20,
+    pool_timeout=30,
+    # Cache skompilowanych instrukcji SQLAlchemy (domyślnie 500) - z zapasem
+    # na wszystkie kształty zapytań serwisu
+    query_cache_size=1200,
+    # Krótkie zapytania (np. wyszukiwanie użytkownika po PK) trafiają w cache
+    # przygotowanych instrukcji, a JIT tylko wydłuża ich planowanie
+    connect_args={
+        "statement_cache_size": 1024,
+        "prepared_statement_cache_size": 512,
+        "server_settings": {"jit": "off"}
+    }
 )
 
+logger = logging.getLogger(__name__)
+
+# Zapytania wolniejsze niż ten próg (w sekundach) są logowane jako ostrzeżenia
+SLOW_QUERY_THRESHOLD = 0.1
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """Zapamiętanie czasu rozpoczęcia zapytania"""
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    """Logowanie zapytań przekraczających SLOW_QUERY_THRESHOLD"""
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    if elapsed > SLOW_QUERY_THRESHOLD:
+        logger.warning(f"Slow query ({elapsed * 1000:.0f} ms): {statement}")
+
 # Tworzenie sesji
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 # Bazowa klasa dla modeli
 Base = declarative_base()
 
-def get_db() -> Generator[Session, None, None]:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """Dependency do pobierania sesji bazy danych"""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-def create_tables():
+async def create_tables():
     """Tworzenie tabel w bazie danych"""
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
 
-def drop_tables():
+async def drop_tables():
     """Usuwanie tabel z bazy danych"""
-    Base.metadata.drop_all(bind=engine)
-
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
@@ -3,16 +3,22 @@ CloudWatch Pro - User Service
 Mikrousługa odpowiedzialna za zarządzanie użytkownikami, uwierzytelnianie i autoryzację.
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Response, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select, update, func, or_, bindparam
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+from uuid import UUID
 import uvicorn
 import os
+import asyncio
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 
-from database import get_db, engine, Base
+from database import get_db, engine, create_tables, SessionLocal
 from models import User, Organization, UserOrganization
 from schemas import (
     UserCreate, UserResponse, UserLogin, Token, 
@@ -20,19 +26,30 @@ from schemas import (
 )
 from auth import (
     create_access_token, verify_token, get_password_hash, 
-    verify_password, get_current_user
+    verify_and_update_password, get_current_user, redis_pool, cache_invalidation_listener,
+    invalidate_user_cache, profile_cache
 )
 from config import settings
 
-# Tworzenie tabel w bazie danych
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Tworzenie tabel (AUTO_MIGRATE), nasłuch unieważnień cache i zamknięcie pul połączeń"""
+    if settings.AUTO_MIGRATE:
+        await create_tables()
+    listener_task = asyncio.create_task(cache_invalidation_listener())
+    yield
+    listener_task.cancel()
+    await redis_pool.aclose()
+    await engine.dispose()
 
 app = FastAPI(
     title="CloudWatch Pro - User Service",
     description="Mikrousługa zarządzania użytkownikami i uwierzytelniania",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Konfiguracja CORS
@@ -62,50 +79,61 @@ async def health_check():
     return {"status": "healthy"}
 
 @app.post("/auth/register", response_model=UserResponse)
-async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Rejestracja nowego użytkownika"""
     
-    # Sprawdzenie czy użytkownik już istnieje
-    existing_user = db.query(User).filter(
-        (User.email == user_data.email) | (User.username == user_data.username)
-    ).first()
+    # Hashowanie hasła
+    hashed_password = await get_password_hash(user_data.password)
+    
+    # Tworzenie nowego użytkownika jednym zapytaniem - konflikt na unikalnym
+    # email lub username pomija wstawienie zamiast osobnego sprawdzenia
+    result = await db.execute(
+        insert(User)
+        .values(
+            username=user_data.username,
+            email=user_data.email,
+            password_hash=hashed_password,
+            first_name=user_data.first_name,
+            last_name=user_data.last_name,
+            role=user_data.role or "user"
+        )
+        .on_conflict_do_nothing()
+        .returning(User)
+    )
+    db_user = result.scalars().first()
     
-    if existing_user:
+    if db_user is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User with this email or username already exists"
         )
     
-    # Hashowanie hasła
-    hashed_password = get_password_hash(user_data.password)
-    
-    # Tworzenie nowego użytkownika
-    db_user = User(
-        username=user_data.username,
-        email=user_data.email,
-        password_hash=hashed_password,
-        first_name=user_data.first_name,
-        last_name=user_data.last_name,
-        role=user_data.role or "user"
-    )
-    
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     
     return UserResponse.from_orm(db_user)
 
+# Zapytanie logowania budowane raz - jeden parametr :login dla obu kolumn,
+# więc klucz cache skompilowanego SQL i przygotowana instrukcja są stałe
+LOGIN_QUERY = select(User).where(
+    or_(User.email == bindparam("login"), User.username == bindparam("login"))
+)
+
 @app.post("/auth/login", response_model=Token)
-async def login_user(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login_user(
+    user_credentials: UserLogin,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
     """Logowanie użytkownika"""
     
     # Znajdowanie użytkownika po email lub username
-    user = db.query(User).filter(
-        (User.email == user_credentials.username) | 
-        (User.username == user_credentials.username)
-    ).first()
+    result = await db.execute(LOGIN_QUERY, {"login": user_credentials.username})
+    user = result.scalars().first()
     
-    if not user or not verify_password(user_credentials.password, user.password_hash):
+    password_valid, new_hash = False, None
+    if user:
+        password_valid, new_hash = await verify_and_update_password(user_credentials.password, user.password_hash)
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -118,30 +146,51 @@ async def login_user(user_credentials: UserLogin, db: Session = Depends(get_db))
             detail="User account is disabled"
         )
     
-    # Aktualizacja czasu ostatniego logowania
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # Zapis czasu logowania (i ewentualnego nowego hasha) już po wysłaniu odpowiedzi
+    background_tasks.add_task(record_login, user.id, new_hash)
     
     # Tworzenie tokenu dostępu
-    access_token = create_access_token(
+    access_token = await create_access_token(
         data={"sub": str(user.id), "username": user.username, "role": user.role}
     )
     
     return Token(access_token=access_token, token_type="bearer")
 
+async def record_login(user_id: UUID, new_hash: Optional[str]):
+    """Zapis czasu ostatniego logowania (zadanie w tle)"""
+    values = {"last_login": func.now()}
+    # Hashe bcrypt są przy logowaniu zastępowane tańszym w weryfikacji argon2id
+    if new_hash:
+        values["password_hash"] = new_hash
+    
+    async with SessionLocal() as db:
+        await db.execute(update(User).where(User.id == user_id).values(**values))
+        await db.commit()
+    await invalidate_user_cache(str(user_id))
+
 @app.get("/auth/me", response_model=UserResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     """Pobieranie informacji o aktualnie zalogowanym użytkowniku"""
-    return UserResponse.from_orm(current_user)
+    # Gotowy JSON z cache zamiast walidacji modelu przy każdym żądaniu
+    user_id = str(current_user.id)
+    body = profile_cache.get(user_id)
+    if body is None:
+        body = UserResponse.from_orm(current_user).model_dump_json()
+        profile_cache[user_id] = body
+    return Response(content=body, media_type="application/json")
 
 @app.put("/users/profile", response_model=UserResponse)
 async def update_user_profile(
     user_update: UserCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Aktualizacja profilu użytkownika"""
     
+    # Użytkownik z cache jest odłączony od sesji - zmiany zapisujemy na świeżo
+    # wczytanym egzemplarzu, a nie na obiekcie współdzielonym przez cache
+    current_user = await db.get(User, current_user.id, populate_existing=True)
+    
     # Aktualizacja danych użytkownika
     if user_update.first_name:
         current_user.first_name = user_update.first_name
@@ -149,26 +198,35 @@ async def update_user_profile(
         current_user.last_name = user_update.last_name
     if user_update.email and user_update.email != current_user.email:
         # Sprawdzenie czy nowy email nie jest już zajęty
-        existing_user = db.query(User).filter(User.email == user_update.email).first()
-        if existing_user:
+        result = await db.execute(select(User.id).where(User.email == user_update.email).limit(1))
+        if result.scalar() is not None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
             )
         current_user.email = user_update.email
     
-    current_user.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(current_user)
+    current_user.updated_at = func.now()
+    await db.commit()
+    await invalidate_user_cache(str(current_user.id))
     
     return UserResponse.from_orm(current_user)
 
+@app.get("/users/me/preferences")
+async def get_user_preferences(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Pobieranie preferencji zalogowanego użytkownika"""
+    result = await db.execute(select(User.preferences).where(User.id == current_user.id))
+    return ORJSONResponse(content=result.scalar() or {})
+
 @app.get("/users", response_model=List[UserResponse])
 async def list_users(
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Lista użytkowników (tylko dla administratorów)"""
     
@@ -178,14 +236,22 @@ async def list_users(
             detail="Not enough permissions"
         )
     
-    users = db.query(User).offset(skip).limit(limit).all()
-    return [UserResponse.from_orm(user) for user in users]
+    # Wiersze jako słowniki serializowane bezpośrednio przez orjson, bez
+    # budowania obiektów ORM i modeli Pydantic dla każdego użytkownika
+    result = await db.execute(
+        select(
+            User.username, User.email, User.first_name, User.last_name, User.id,
+            User.role, User.is_active, User.created_at, User.updated_at,
+            User.last_login
+        ).offset(skip).limit(limit)
+    )
+    return ORJSONResponse(content=[dict(row) for row in result.mappings()])
 
 @app.post("/organizations", response_model=OrganizationResponse)
 async def create_organization(
     org_data: OrganizationCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Tworzenie nowej organizacji"""
     
@@ -195,60 +261,60 @@ async def create_organization(
         description=org_data.description
     )
     
-    db.add(db_org)
-    db.commit()
-    db.refresh(db_org)
-    
-    # Dodanie twórcy jako właściciela organizacji
+    # Dodanie twórcy jako właściciela organizacji - powiązanie przez relację,
+    # więc obie encje trafiają do bazy w jednej transakcji i jednym commit
     user_org = UserOrganization(
         user_id=current_user.id,
-        organization_id=db_org.id,
+        organization=db_org,
         role="owner"
     )
     
-    db.add(user_org)
-    db.commit()
+    db.add_all([db_org, user_org])
+    await db.commit()
     
     return OrganizationResponse.from_orm(db_org)
 
 @app.get("/organizations", response_model=List[OrganizationResponse])
 async def list_user_organizations(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Lista organizacji użytkownika"""
     
-    user_orgs = db.query(UserOrganization).filter(
-        UserOrganization.user_id == current_user.id
-    ).all()
-    
-    organizations = []
-    for user_org in user_orgs:
-        org = db.query(Organization).filter(
-            Organization.id == user_org.organization_id
-        ).first()
-        if org:
-            organizations.append(OrganizationResponse.from_orm(org))
+    # Jedno zapytanie z join zamiast osobnego zapytania dla każdej organizacji
+    result = await db.execute(
+        select(Organization)
+        .join(UserOrganization, UserOrganization.organization_id == Organization.id)
+        .where(UserOrganization.user_id == current_user.id)
+    )
     
-    return organizations
+    return [OrganizationResponse.from_orm(org) for org in result.scalars().all()]
 
 @app.get("/auth/verify")
 async def verify_token_endpoint(current_user: User = Depends(get_current_user)):
     """Weryfikacja tokenu (dla innych mikrousług)"""
-    return {
+    # Wywoływane przy każdym żądaniu innych usług - odpowiedź trafia wprost
+    # do orjson, bez przechodzenia przez jsonable_encoder
+    return ORJSONResponse(content={
         "valid": True,
         "user_id": str(current_user.id),
         "username": current_user.username,
         "role": current_user.role,
         "is_active": current_user.is_active
-    }
+    })
 
 if __name__ == "__main__":
+    # Jeden worker na każdy CPU dostępny dla procesu (z uwzględnieniem limitów
+    # cgroup/affinity), z możliwością nadpisania przez WEB_CONCURRENCY
+    workers = int(os.getenv("WEB_CONCURRENCY", len(os.sched_getaffinity(0))))
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=int(os.getenv("PORT", 8001)),
-        reload=True
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        access_log=settings.DEBUG
     )
 
 
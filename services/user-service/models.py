@@ -2,14 +2,13 @@
 Modele bazy danych dla User Service
 """
 
-from sqlalchemy import Column, String, Boolean, DateTime, Text, ForeignKey, Table
+from sqlalchemy import Column, String, Boolean, DateTime, Text, ForeignKey, Table, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 import uuid
 
-Base = declarative_base()
+from database import Base
 
 class User(Base):
     """Model użytkownika"""
@@ -26,11 +25,20 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     last_login = Column(DateTime(timezone=True))
-    preferences = Column(JSONB, default={})
+    # Ładowane tylko na żądanie (zob. /users/me/preferences) - pozostałe
+    # zapytania o użytkownika nie przesyłają tego JSONB
+    preferences = deferred(Column(JSONB, default={}), raiseload=True)
     
     # Relacje
     organizations = relationship("UserOrganization", back_populates="user")
     
+    __table_args__ = (
+        Index("ix_users_role_active", "role", "is_active"),
+    )
+    # Wartości domyślne z serwera (created_at, updated_at) wracają przez
+    # RETURNING w tym samym INSERT/UPDATE, bez dodatkowego SELECT
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<User(id={self.id}, username={self.username}, email={self.email})>"
 
@@ -48,6 +56,8 @@ class Organization(Base):
     # Relacje
     users = relationship("UserOrganization", back_populates="organization")
     
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<Organization(id={self.id}, name={self.name})>"
 
@@ -82,6 +92,10 @@ class APIKey(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_used = Column(DateTime(timezone=True))
     
+    __table_args__ = (
+        Index("ix_api_keys_user_active", "user_id", "is_active"),
+    )
+    
     def __repr__(self):
         return f"<APIKey(id={self.id}, name={self.name}, user_id={self.user_id})>"
 
@@ -98,6 +112,10 @@ class UserSession(Base):
     expires_at = Column(DateTime(timezone=True), nullable=False)
     is_active = Column(Boolean, default=True)
     
+    __table_args__ = (
+        Index("ix_user_sessions_user_active", "user_id", "is_active"),
+    )
+    
     def __repr__(self):
         return f"<UserSession(id={self.id}, user_id={self.user_id}, ip={self.ip_address})>"
 
@@ -3,7 +3,7 @@ Schematy Pydantic dla walidacji danych w User Service
 """
 
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 from uuid import UUID
 
@@ -17,7 +17,7 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     """Schemat tworzenia użytkownika"""
     password: str = Field(..., min_length=8, max_length=128)
-    role: Optional[str] = Field("user", regex="^(user|admin|super_admin|viewer)$")
+    role: Optional[Literal["user", "admin", "super_admin", "viewer"]] = "user"
 
 class UserUpdate(BaseModel):
     """Schemat aktualizacji użytkownika"""
@@ -37,7 +37,6 @@ class UserResponse(UserBase):
     created_at: datetime
     updated_at: datetime
     last_login: Optional[datetime] = None
-    preferences: Dict[str, Any] = {}
 
 class UserLogin(BaseModel):
     """Schemat logowania użytkownika"""
@@ -5,12 +5,14 @@ CloudWatch Pro - API Tests
 import pytest
 import requests
 import json
+import jwt
 from datetime import datetime
 
 # Test configuration
 BASE_URL = "http://localhost:8000"
 USER_SERVICE_URL = "http://localhost:8001"
 METRICS_SERVICE_URL = "http://localhost:8002"
+COST_SERVICE_URL = "http://localhost:8004"
 
 class TestUserService:
     """Test User Service endpoints"""
@@ -42,6 +44,28 @@ class TestUserService:
         }
         response = requests.post(f"{USER_SERVICE_URL}/login", data=login_data)
         assert response.status_code in [200, 401]  # 401 if credentials invalid
+    
+    def test_access_token_matches_pyjwt_encoding(self):
+        """Test access tokens are encoded exactly as PyJWT would, including non-ASCII claims"""
+        user_data = {
+            "username": "zażółć_user",
+            "email": "zazolc@example.com",
+            "password": "testpassword123"
+        }
+        requests.post(f"{USER_SERVICE_URL}/auth/register", json=user_data)
+        
+        response = requests.post(
+            f"{USER_SERVICE_URL}/auth/login",
+            json={"username": user_data["username"], "password": user_data["password"]}
+        )
+        assert response.status_code == 200
+        token = response.json()["access_token"]
+        
+        # The signing key is not known here, so compare header and payload only
+        payload = jwt.decode(token, options={"verify_signature": False})
+        assert payload["username"] == user_data["username"]
+        expected = jwt.encode(payload, "test-key", algorithm=jwt.get_unverified_header(token)["alg"])
+        assert token.rsplit(".", 1)[0] == expected.rsplit(".", 1)[0]
 
 class TestMetricsService:
     """Test Metrics Collector Service endpoints"""
@@ -72,6 +96,16 @@ class TestMetricsService:
         data = response.json()
         assert "metrics" in data
 
+class TestCostAnalyzer:
+    """Test Cost Analyzer Service endpoints"""
+    
+    def test_daily_costs_newest_first(self):
+        """Test daily costs are returned in non-increasing date order"""
+        response = requests.get(f"{COST_SERVICE_URL}/costs/daily", params={"days": 7})
+        assert response.status_code == 200
+        dates = [item["date"] for item in response.json()]
+        assert dates == sorted(dates, reverse=True)
+
 class TestAPIGateway:
     """Test API Gateway endpoints"""
     
@@ -113,6 +147,28 @@ class TestIntegration:
         data = get_response.json()
         assert "metrics" in data
 
+    def test_gateway_accepts_user_service_token(self):
+        """Test API gateway accepts an access token issued by user service"""
+        user_data = {
+            "username": "gatewayuser",
+            "email": "gateway@example.com",
+            "password": "gatewaypassword123"
+        }
+        requests.post(f"{USER_SERVICE_URL}/auth/register", json=user_data)
+
+        login_response = requests.post(
+            f"{USER_SERVICE_URL}/auth/login",
+            json={"username": user_data["username"], "password": user_data["password"]}
+        )
+        assert login_response.status_code == 200
+        token = login_response.json()["access_token"]
+
+        response = requests.get(
+            f"{BASE_URL}/gateway/services",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200
+
 if __name__ == "__main__":
     # Run basic connectivity tests
     print("Running CloudWatch Pro API Tests...")